@@ -0,0 +1,335 @@
+"""
+Scores the emails of a CSV file of any size with the classifier, writing the predictions to a CSV or Parquet file.
+
+The input is read in chunks of rows, and each chunk goes through the stages read, clean, tokenize, predict and write.
+Each stage runs in its own thread, so consecutive chunks are processed at the same time (e.g. the next chunk is cleaned
+while the model predicts the current one), and only a few chunks are held in memory.
+
+The output is written chunk by chunk, and the number of rows written is saved to <output>.progress.json after each
+chunk. If scoring is interrupted, running the same command again resumes after the last chunk written.
+
+Usage:
+    python3 batch_score.py emails.csv predictions.csv [--chunksize 10000] [--text-column text] [--id-column id]
+    python3 batch_score.py emails.csv predictions.parquet
+"""
+
+import argparse
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import pandas as pd
+from predict_input import MODEL, tokenizer, classifier_version, predict_sequences
+from preprocessing import clean_texts
+
+# Number of rows read, cleaned and predicted at a time
+SCORE_CHUNK_ROWS = 10000
+# Number of chunks waiting between two stages
+PIPELINE_DEPTH = 2
+
+# Progress files written by another version are not used to resume
+PROGRESS_VERSION = 1
+
+_DONE = object()
+
+
+def read_chunks(path, text_column='text', id_column=None, chunksize=SCORE_CHUNK_ROWS, skip_rows=0):
+    """
+    Reads the emails of a CSV file in chunks of rows.
+
+    Args:
+        path (str): The path of the CSV file.
+        text_column (str): The column with the text of the emails.
+        id_column (str): A column identifying the emails, copied to the output, or None.
+        chunksize (int): The number of rows in each chunk.
+        skip_rows (int): The number of rows already scored, which are skipped.
+
+    Yields:
+        Dictionaries {'start': position of the first row, 'ids': array of IDs or None, 'texts': list of texts}.
+    """
+    columns = [text_column] if id_column is None else [text_column, id_column]
+    reader = pd.read_csv(path, usecols=columns, chunksize=chunksize)
+    try:
+        start = 0
+        for df in reader:
+            end = start + len(df)
+            if end > skip_rows:
+                df = df.iloc[max(0, skip_rows - start):]
+                yield {
+                    'start': end - len(df),
+                    'ids': None if id_column is None else df[id_column].to_numpy(),
+                    'texts': df[text_column].fillna('').astype(str).tolist()
+                }
+            start = end
+    finally:
+        reader.close()
+
+
+def pipelined(items, stages, depth=PIPELINE_DEPTH):
+    """
+    Applies functions to items in stages, each stage in its own thread, connected by queues of at most <depth> items.
+
+    Args:
+        items (iterable): The items, consumed in a separate thread.
+        stages (list): The functions applied to each item, in order.
+        depth (int): The maximum number of items waiting between two stages.
+
+    Yields:
+        The result of the last stage for each item, in order.
+    """
+    queues = [queue.Queue(maxsize=depth) for _ in range(len(stages) + 1)]
+
+    def feed():
+        try:
+            for item in items:
+                queues[0].put((item, None))
+        except Exception as e:
+            queues[0].put((None, e))
+        queues[0].put((_DONE, None))
+
+    def run(stage, inputs, outputs):
+        while True:
+            item, error = inputs.get()
+            if item is not _DONE and error is None:
+                try:
+                    item = stage(item)
+                except Exception as e:
+                    item, error = None, e
+            outputs.put((item, error))
+            if item is _DONE:
+                return
+
+    # Daemon threads, so that the program can exit if the consumer fails while they are waiting
+    threading.Thread(target=feed, daemon=True).start()
+    for stage, inputs, outputs in zip(stages, queues, queues[1:]):
+        threading.Thread(target=run, args=(stage, inputs, outputs), daemon=True).start()
+
+    while True:
+        item, error = queues[-1].get()
+        if error is not None:
+            raise error
+        if item is _DONE:
+            return
+        yield item
+
+
+def clean_chunk(chunk):
+    chunk['texts'] = clean_texts(chunk['texts'])
+    return chunk
+
+
+def tokenize_chunk(chunk):
+    chunk['sequences'] = tokenizer.texts_to_sequences(chunk.pop('texts'))
+    return chunk
+
+
+def predict_chunk(chunk):
+    chunk['probabilities'] = predict_sequences(chunk.pop('sequences'), MODEL)
+    return chunk
+
+
+def chunk_predictions(chunk, id_column=None):
+    """
+    Returns:
+        A Pandas dataframe of the predictions of a chunk, with the columns 'row' (the position of the row in the input),
+        <id_column> if given, 'label' ('spam' or 'ham') and 'probability' (the probability of spam).
+    """
+    probabilities = chunk['probabilities']
+    df = pd.DataFrame({'row': range(chunk['start'], chunk['start'] + len(probabilities))})
+    if id_column is not None:
+        df[id_column] = chunk['ids']
+    df['label'] = ['spam' if probability >= 0.5 else 'ham' for probability in probabilities]
+    df['probability'] = probabilities
+    return df
+
+
+class CSVOutput(object):
+    """
+    CSV output file, appended to chunk by chunk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+
+    def open(self, state):
+        """
+        Prepares the file for writing.
+
+        Args:
+            state (dict): The state returned by write for the last chunk saved in the progress file, or None to start a
+                new file. Anything written after that chunk is removed.
+        """
+        self.size = 0 if state is None else state['bytes']
+        with open(self.path, 'ab') as fp:
+            fp.truncate(self.size)
+
+    def write(self, df):
+        """
+        Appends the rows of <df>, and waits for them to be written to disk.
+
+        Returns:
+            The state of the file, to resume after this chunk.
+        """
+        with open(self.path, 'a', newline='', encoding='utf-8') as fp:
+            df.to_csv(fp, header=self.size == 0, index=False)
+            fp.flush()
+            os.fsync(fp.fileno())
+            self.size = os.fstat(fp.fileno()).st_size
+        return {'bytes': self.size}
+
+
+class ParquetOutput(object):
+    """
+    Parquet output, written as a directory with a Parquet file for each chunk, which Pandas reads as one dataset.
+    """
+
+    def __init__(self, path):
+        # Fails before anything is predicted if there is no Parquet library (pyarrow or fastparquet)
+        pd.io.parquet.get_engine('auto')
+        self.path = path
+        self.parts = 0
+
+    def open(self, state):
+        """
+        Prepares the directory for writing.
+
+        Args:
+            state (dict): The state returned by write for the last chunk saved in the progress file, or None to start a
+                new dataset. The files written after that chunk are removed.
+        """
+        self.parts = 0 if state is None else state['parts']
+        os.makedirs(self.path, exist_ok=True)
+        for name in os.listdir(self.path):
+            if name.startswith('part-') and (not name.endswith('.parquet') or int(name[5:11]) >= self.parts):
+                os.remove(os.path.join(self.path, name))
+
+    def write(self, df):
+        """
+        Writes the rows of <df> to a new file.
+        The file is written to a temporary file first, and then renamed, so a partially written file is never read.
+
+        Returns:
+            The state of the directory, to resume after this chunk.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self.path, prefix='part-', suffix='.tmp')
+        os.close(fd)
+        try:
+            df.to_parquet(temp_path, index=False)
+            os.replace(temp_path, os.path.join(self.path, 'part-{:06d}.parquet'.format(self.parts)))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self.parts += 1
+        return {'parts': self.parts}
+
+
+def progress_path(output):
+    """
+    Returns:
+        The path of the progress file of <output>.
+    """
+    return output.rstrip('/\\') + '.progress.json'
+
+
+def save_progress(path, progress):
+    """Saves the progress file, replacing it atomically."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(progress, fp)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def score(input_path, output_path, output_format=None, text_column='text', id_column=None,
+          chunksize=SCORE_CHUNK_ROWS, overwrite=False):
+    """
+    Scores the emails of a CSV file, resuming from the progress file of the output if there is one.
+
+    Args:
+        input_path (str): The path of the CSV file.
+        output_path (str): The path of the output CSV file, or Parquet directory.
+        output_format (str): 'csv' or 'parquet', or None to use the extension of <output_path>.
+        text_column (str): The column with the text of the emails.
+        id_column (str): A column identifying the emails, copied to the output, or None.
+        chunksize (int): The number of rows scored at a time.
+        overwrite (bool): Whether to start again, instead of resuming.
+
+    Returns:
+        The number of rows in the output.
+    """
+    if output_format is None:
+        output_format = 'parquet' if output_path.rstrip('/\\').endswith('.parquet') else 'csv'
+    output = ParquetOutput(output_path) if output_format == 'parquet' else CSVOutput(output_path)
+
+    stat = os.stat(input_path)
+    expected = {
+        'version': PROGRESS_VERSION,
+        'input': {'path': os.path.abspath(input_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns},
+        'model': classifier_version(MODEL),
+        'format': output_format,
+        'text_column': text_column,
+        'id_column': id_column
+    }
+
+    # Resume from the last chunk written, if the output was written from the same input, with the same model
+    path = progress_path(output_path)
+    progress = None
+    if not overwrite and os.path.exists(path):
+        with open(path) as fp:
+            progress = json.load(fp)
+        if any(progress.get(key) != value for key, value in expected.items()):
+            raise SystemExit("{} was written from another input, model or settings. Use --overwrite to start "
+                             "again.".format(output_path))
+        if progress['done']:
+            print("{} is already complete ({:,} rows).".format(output_path, progress['rows']))
+            return progress['rows']
+        print("Resuming after {:,} rows.".format(progress['rows']))
+    elif not overwrite and os.path.exists(output_path):
+        raise SystemExit("{} already exists. Use --overwrite to replace it.".format(output_path))
+
+    rows = 0 if progress is None else progress['rows']
+    state = None if progress is None else progress['output']
+    output.open(state)
+
+    start = time.perf_counter()
+    scored = 0
+    chunks = read_chunks(input_path, text_column, id_column, chunksize, skip_rows=rows)
+    for chunk in pipelined(chunks, [clean_chunk, tokenize_chunk, predict_chunk]):
+        df = chunk_predictions(chunk, id_column)
+        state = output.write(df)
+        rows += len(df)
+        scored += len(df)
+        save_progress(path, dict(expected, rows=rows, output=state, done=False))
+
+        elapsed = time.perf_counter() - start
+        print("{:,} rows scored ({:,.0f} rows/s)".format(rows, scored / elapsed))
+
+    if state is None:
+        # The input has no rows, but the output is still created
+        state = output.write(chunk_predictions({'start': 0, 'ids': [], 'probabilities': []}, id_column))
+    save_progress(path, dict(expected, rows=rows, output=state, done=True))
+    elapsed = time.perf_counter() - start
+    print("Done: {:,} rows scored in {:.1f} s ({:,.0f} rows/s), written to {}".format(
+        scored, elapsed, scored / elapsed if elapsed else 0, output_path))
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('input', help="CSV file of emails")
+    parser.add_argument('output', help="Output CSV file, or Parquet directory (*.parquet)")
+    parser.add_argument('--format', help="Output format (default: from the extension of the output)",
+                        choices=['csv', 'parquet'])
+    parser.add_argument('--text-column', help="Column with the text of the emails", default='text')
+    parser.add_argument('--id-column', help="Column identifying the emails, copied to the output")
+    parser.add_argument('--chunksize', help="Number of rows scored at a time", type=int, default=SCORE_CHUNK_ROWS)
+    parser.add_argument('--overwrite', help="Start again instead of resuming", action="store_true")
+    args = parser.parse_args()
+
+    score(args.input, args.output, args.format, args.text_column, args.id_column, args.chunksize, args.overwrite)
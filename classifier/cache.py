@@ -0,0 +1,240 @@
+"""
+Thread-safe, bounded least-recently-used (LRU) cache, so that the same work is not repeated. Used by predict_input.py
+for the predicted probabilities, and by the Dash app (which has this directory in its path) for the search results and
+the uploaded datasets.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Pending(object):
+    """A value that is being computed by another thread."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class LRUCache(object):
+    """
+    Least-recently-used cache, bounded by the number of entries and by the total size of the entries.
+    When either bound is exceeded, the least recently used entries are evicted.
+    Entries can also expire when they have not been used for some time.
+    """
+
+    def __init__(self, max_entries=128, max_size=None, sizeof=len, ttl=None):
+        """
+        Args:
+            max_entries (int): The maximum number of entries.
+            max_size (int): The maximum total size of the entries, or None for no limit.
+            sizeof (function): Returns the size of a value.
+            ttl (float): The number of seconds an entry is kept after it was last used, or None to keep it until it is
+                evicted.
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.ttl = ttl
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size = 0
+
+        self._entries = OrderedDict()  # key --> (value, size, expiry time)
+        self._pending = {}  # key --> _Pending, for values that are being computed
+        self._lock = threading.Lock()
+
+    def _expiry(self):
+        """Returns the expiry time of an entry that is used now."""
+        return None if self.ttl is None else time.monotonic() + self.ttl
+
+    def _lookup(self, key):
+        """Returns the entry for key, marking it as the most recently used, or None if it is not cached.
+        Must be called with the lock held."""
+        self._remove_expired()
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            if self.ttl is not None:
+                entry = self._entries[key] = (entry[0], entry[1], self._expiry())
+        return entry
+
+    def _remove_expired(self):
+        """Removes the expired entries. Must be called with the lock held.
+        Using an entry renews it, so the entries expire in least-recently-used order."""
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        while self._entries:
+            key, (_, size, expiry) = next(iter(self._entries.items()))
+            if expiry > now:
+                break
+            del self._entries[key]
+            self.size -= size
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Gets the value cached for <key>, marking it as the most recently used.
+
+        Args:
+            key: A hashable key.
+            default: The value to return if <key> is not cached.
+
+        Returns:
+            The cached value, or <default>.
+        """
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key, default=None):
+        """
+        Gets the value cached for <key>, without marking it as used or counting it in the statistics.
+
+        Args:
+            key: A hashable key.
+            default: The value to return if <key> is not cached.
+
+        Returns:
+            The cached value, or <default>.
+        """
+        with self._lock:
+            self._remove_expired()
+            entry = self._entries.get(key)
+            return default if entry is None else entry[0]
+
+    def keys(self):
+        """
+        Returns:
+            A list of the cached keys, from least to most recently used.
+        """
+        with self._lock:
+            self._remove_expired()
+            return list(self._entries)
+
+    def put(self, key, value):
+        """
+        Caches <value> for <key>, evicting the least recently used entries if the cache is full.
+        Values larger than max_size are not cached.
+
+        Args:
+            key: A hashable key.
+            value: The value to cache.
+        """
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+
+            if self.max_size is not None and size > self.max_size:
+                return
+
+            self._entries[key] = (value, size, self._expiry())
+            self.size += size
+
+            self._remove_expired()
+            while len(self._entries) > self.max_entries or (self.max_size is not None and self.size > self.max_size):
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        """
+        Gets the value cached for <key>, computing and caching it with <compute> if it is not cached.
+        If another thread is already computing the value for <key>, waits for its result instead of computing it again.
+        If that thread fails, the value is computed again with <compute>, as errors are not cached.
+
+        Args:
+            key: A hashable key.
+            compute (function): Computes the value, takes no arguments.
+
+        Returns:
+            The value for <key>.
+        """
+        while True:
+            with self._lock:
+                entry = self._lookup(key)
+                if entry is not None:
+                    self.hits += 1
+                    return entry[0]
+
+                pending = self._pending.get(key)
+                if pending is None:
+                    self.misses += 1
+                    pending = self._pending[key] = _Pending()
+                    break
+
+            # Answered by the thread that is already computing it
+            pending.done.wait()
+            if pending.error is None:
+                with self._lock:
+                    self.hits += 1
+                return pending.value
+
+        try:
+            pending.value = compute()
+        except BaseException as e:
+            pending.error = e
+            raise
+        else:
+            self.put(key, pending.value)
+            return pending.value
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.done.set()
+
+    def pop(self, key, default=None):
+        """
+        Removes the entry for <key>.
+
+        Args:
+            key: A hashable key.
+            default: The value to return if <key> is not cached.
+
+        Returns:
+            The removed value, or <default>.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.size -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        """Removes every entry from the cache."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns:
+            A dictionary of the cache statistics.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'size': self.size,
+            }
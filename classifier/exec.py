@@ -3,6 +3,7 @@ Trains and saves the classifier model.
 """
 
 import os
+import shutil
 from datetime import datetime
 import numpy as np
 import matplotlib.pyplot as plt
@@ -49,11 +50,14 @@ classifier.compile(loss='binary_crossentropy', optimizer='adam', metrics=['accur
 if __name__ == '__main__':
     now = datetime.now().strftime('%Y%m%d%H%M%S')
     model_filename = now + '_spam_classifier.h5'
+    tokenizer_filename = now + '_tokenizer.json'
     accplot_filename = now + '_plot.png'
 
     history = classifier.fit(x_train, y_train, validation_data=(x_test, y_test), **TRAIN_PARAMS)
 
     classifier.save(f'{MODEL_DIR}{model_filename}')
+    # Save the tokenizer that produced the training data with the model, as predictions must use the same one
+    shutil.copyfile(f'{DATA_DIR}tokenizer.json', f'{MODEL_DIR}{tokenizer_filename}')
 
     plt.plot(history.history['accuracy'])
     plt.plot(history.history['val_accuracy'])
@@ -0,0 +1,233 @@
+"""
+Client of the inference server (inference_server.py), which owns the model in a separate process.
+
+The web application uses this client instead of loading the model itself, so that it does not import TensorFlow, and
+the predictions of concurrent requests are batched together by the server instead of contending with each other.
+Messages are JSON, sent over a local connection (multiprocessing.connection), one request at a time per connection.
+This module must not import TensorFlow.
+
+Usage:
+    client = InferenceClient()
+    client.predict(['Subject: FREE money!!!'])  # [1]
+"""
+
+import atexit
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Client
+
+INFERENCE_ADDRESS = ('127.0.0.1', 8051)
+# Seconds to wait for a prediction, including the time for the server to load the model when it starts
+INFERENCE_TIMEOUT = 120
+
+SERVER_SCRIPT = os.path.dirname(os.path.abspath(__file__)) + '/inference_server.py'
+
+
+class InferenceClient(object):
+    """
+    Sends texts to the inference server and returns its predictions.
+    Each thread uses its own connection, opened on its first request, so the client can be shared by threads (and
+    created before the server processes are forked).
+    """
+
+    def __init__(self, address=INFERENCE_ADDRESS, timeout=INFERENCE_TIMEOUT):
+        """
+        Args:
+            address (tuple): The (host, port) the inference server listens on.
+            timeout (float): Seconds to wait for each prediction.
+        """
+        self.address = address
+        self.timeout = timeout
+        self._local = threading.local()
+        self._ids = itertools.count()
+
+    def _connection(self):
+        # A connection is only used by the thread that opened it, in the process that opened it
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.connection = Client(self.address)
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _close(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = self._local.pid = None
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+    def predict_probabilities(self, texts):
+        """
+        Predicts the probability that each text is spam.
+
+        Args:
+            texts (list): A list of text to predict.
+
+        Returns:
+            A list of the probability of each text, in order.
+
+        Raises:
+            ConnectionError: The inference server is not running.
+            TimeoutError: The inference server did not answer within the timeout.
+            RuntimeError: The inference server failed to predict the texts.
+        """
+        request_id = next(self._ids)
+        message = json.dumps({'id': request_id, 'texts': [str(text) for text in texts]}).encode('utf-8')
+
+        # A connection may have been closed by a restart of the server since it was last used, so it is opened again
+        # once. The request is only sent again if it could not be sent, so a prediction is never made twice.
+        for attempt in range(2):
+            try:
+                connection = self._connection()
+                connection.send_bytes(message)
+                break
+            except OSError:
+                self._close()
+                if attempt:
+                    raise
+
+        try:
+            if not connection.poll(self.timeout):
+                raise TimeoutError("The inference server did not answer within {} s.".format(self.timeout))
+            response = json.loads(connection.recv_bytes().decode('utf-8'))
+        except BaseException:
+            # The answer may still arrive later, so the connection cannot be used for the next request
+            self._close()
+            raise
+
+        if response.get('id') != request_id:
+            self._close()
+            raise RuntimeError("Unexpected answer from the inference server.")
+        if response.get('error'):
+            raise RuntimeError(response['error'])
+        return response['probabilities']
+
+    def predict(self, texts):
+        """
+        Predicts whether each text is spam or ham, like predict_input.predict.
+
+        Args:
+            texts (list): A list of text to predict.
+
+        Returns:
+            A list of predictions (1 for spam, 0 for ham).
+        """
+        return [0 if output < 0.5 else 1 for output in self.predict_probabilities(texts)]
+
+    def is_running(self):
+        """
+        Returns:
+            True if the inference server accepts connections.
+        """
+        try:
+            Client(self.address).close()
+        except OSError:
+            return False
+        return True
+
+
+def free_address(host=INFERENCE_ADDRESS[0]):
+    """
+    Returns:
+        A (host, port) address with a port that no process is listening on.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((host, 0))
+        return host, sock.getsockname()[1]
+
+
+def start_inference_server(address=INFERENCE_ADDRESS, batch_window=None, max_batch=None):
+    """
+    Starts the inference server in a separate process, unless one is already running at <address>.
+    A server started by this function is stopped when this process exits. A server that was already running is left
+    running, as it belongs to the process that started it.
+
+    Args:
+        address (tuple): The (host, port) for the server to listen on.
+        batch_window (float): Seconds the server waits for more requests to batch together, or None for the default.
+        max_batch (int): The maximum number of texts predicted together, or None for the default.
+
+    Returns:
+        The server process, or None if a server was already running.
+    """
+    if InferenceClient(address).is_running():
+        return None
+
+    command = [sys.executable, SERVER_SCRIPT, '--host', address[0], '--port', str(address[1])]
+    if batch_window is not None:
+        command += ['--batch-window', str(batch_window)]
+    if max_batch is not None:
+        command += ['--max-batch', str(max_batch)]
+    process = subprocess.Popen(command)
+
+    def stop():
+        if process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    # Only the process that started the server stops it, not the processes forked from it, nor another process that
+    # found it running
+    pid = os.getpid()
+    atexit.register(lambda: os.getpid() == pid and stop())
+    return process
+
+
+def benchmark(texts, clients=16, requests=50, address=INFERENCE_ADDRESS):
+    """
+    Measures the latency and throughput of the inference server under concurrent requests of one text each.
+
+    Args:
+        texts (list): The texts to predict, used in turn.
+        clients (int): The number of threads sending requests at the same time.
+        requests (int): The number of requests sent by each thread.
+        address (tuple): The (host, port) of the inference server.
+
+    Returns:
+        A dictionary {'p50', 'p99' (latencies in seconds), 'requests_per_second'}.
+    """
+    client = InferenceClient(address)
+    client.predict(texts[:1])  # Waits until the model is loaded
+    latencies = []
+    lock = threading.Lock()
+
+    def run(offset):
+        for i in range(requests):
+            start = time.perf_counter()
+            client.predict([texts[(offset * requests + i) % len(texts)]])
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=run, args=(offset,)) for offset in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    results = {
+        'p50': latencies[len(latencies) // 2],
+        'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        'requests_per_second': len(latencies) / elapsed
+    }
+    print('{} clients: p50 {:.3f} s, p99 {:.3f} s, {:.1f} requests/s'.format(
+        clients, results['p50'], results['p99'], results['requests_per_second']))
+    return results
+
+
+if __name__ == '__main__':
+    # Benchmark a running inference server on the email dataset, or on a CSV file with a 'text' column
+    import pandas as pd
+    dataset = sys.argv[1] if len(sys.argv) > 1 else os.path.dirname(os.path.abspath(__file__)) + '/emails.csv'
+    benchmark(pd.read_csv(dataset)['text'].astype(str).tolist())
@@ -0,0 +1,186 @@
+"""
+Inference server, owning the classifier model in its own process.
+
+Requests from the web application (see inference_client.py) are put in a queue. A single thread takes them from the
+queue, and the requests that arrive within BATCH_WINDOW seconds of the first one are predicted together, as one batch
+of up to MAX_BATCH texts, so that concurrent users share the cost of each model.predict call instead of contending for
+the model. The predictions are then sent back to each request.
+
+Usage:
+    python3 inference_server.py [--port 8051] [--batch-window 0.005] [--max-batch 64]
+"""
+
+# Insert into system path
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import argparse
+import json
+import queue
+import threading
+import time
+from multiprocessing.connection import Listener
+from inference_client import INFERENCE_ADDRESS
+
+# Seconds to wait for more requests after the first request of a batch
+BATCH_WINDOW = 0.005
+# Maximum number of texts predicted together. A request with more texts is predicted on its own.
+MAX_BATCH = 64
+
+
+class MicroBatcher(object):
+    """
+    Queue of prediction requests, predicted in batches by a single thread.
+    """
+
+    def __init__(self, predict_batch, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+        """
+        Args:
+            predict_batch (function): Returns the probability of each text in a list of texts.
+            batch_window (float): Seconds to wait for more requests after the first request of a batch.
+            max_batch (int): Maximum number of texts predicted together.
+        """
+        self.predict_batch = predict_batch
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.requests = queue.Queue()
+        # A request that did not fit in the previous batch, and starts the next one
+        self.carried = None
+        self.batches = 0
+        self.texts = 0
+
+    def submit(self, texts, callback):
+        """
+        Adds a request to the queue.
+
+        Args:
+            texts (list): A list of text to predict.
+            callback (function): Called with (probabilities, error) once the texts are predicted, where probabilities
+                is a list of the probability of each text, or None if the prediction failed, and error is the error
+                message.
+        """
+        self.requests.put((texts, callback))
+
+    def next_batch(self):
+        """
+        Waits for the first request of a batch, then for more requests until the batch window has elapsed or the
+        batch is full.
+
+        Returns:
+            A list of (texts, callback) requests.
+        """
+        batch = [self.carried or self.requests.get()]
+        self.carried = None
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.batch_window
+        while size < self.max_batch:
+            try:
+                # Requests already in the queue are added even after the window has elapsed
+                texts, callback = self.requests.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if size + len(texts) > self.max_batch:
+                self.carried = (texts, callback)
+                break
+            batch.append((texts, callback))
+            size += len(texts)
+        return batch
+
+    def run(self):
+        """Predicts the requests in the queue, batch by batch, forever."""
+        while True:
+            batch = self.next_batch()
+            texts = [text for request_texts, _ in batch for text in request_texts]
+            try:
+                probabilities = [float(p) for p in self.predict_batch(texts)] if texts else []
+            except Exception as e:
+                print("[WARNING] Unable to perform prediction:", e)
+                for _, callback in batch:
+                    callback(None, str(e))
+                continue
+
+            self.batches += 1
+            self.texts += len(texts)
+            start = 0
+            for request_texts, callback in batch:
+                callback(probabilities[start:start + len(request_texts)], None)
+                start += len(request_texts)
+
+
+def handle_connection(connection, batcher):
+    """
+    Receives the requests sent on a connection, until it is closed, and sends back their predictions.
+
+    Args:
+        connection: A multiprocessing.connection.Connection with a client.
+        batcher (MicroBatcher): The queue of requests.
+    """
+    lock = threading.Lock()
+
+    def reply(response):
+        with lock:
+            try:
+                connection.send_bytes(json.dumps(response).encode('utf-8'))
+            except OSError:
+                # The client has disconnected
+                pass
+
+    try:
+        while True:
+            try:
+                message = json.loads(connection.recv_bytes().decode('utf-8'))
+                request_id, texts = message['id'], message['texts']
+                if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+                    raise ValueError("'texts' must be a list of strings.")
+            except (EOFError, OSError):
+                break
+            except Exception as e:
+                reply({'id': None, 'error': "Invalid request: {}".format(e)})
+                continue
+
+            batcher.submit(texts, lambda probabilities, error, request_id=request_id: reply(
+                {'id': request_id, 'probabilities': probabilities, 'error': error}))
+    finally:
+        connection.close()
+
+
+def serve(address=INFERENCE_ADDRESS, batch_window=BATCH_WINDOW, max_batch=MAX_BATCH):
+    """
+    Loads the model and answers prediction requests, until the process is stopped.
+
+    Args:
+        address (tuple): The (host, port) to listen on.
+        batch_window (float): Seconds to wait for more requests after the first request of a batch.
+        max_batch (int): Maximum number of texts predicted together.
+    """
+    # Clients can connect (and send requests, which wait in the queue) while the model is loading
+    listener = Listener(address, backlog=64)
+    print("Inference server listening on {}:{}".format(*address))
+
+    from predict_input import predict_probabilities, MODEL
+    batcher = MicroBatcher(lambda texts: predict_probabilities(texts, MODEL), batch_window, max_batch)
+    threading.Thread(target=batcher.run, name='batcher', daemon=True).start()
+
+    try:
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=handle_connection, args=(connection, batcher), daemon=True).start()
+    finally:
+        listener.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', help="Address to listen on", default=INFERENCE_ADDRESS[0])
+    parser.add_argument('--port', help="Port to listen on", type=int, default=INFERENCE_ADDRESS[1])
+    parser.add_argument('--batch-window', help="Seconds to wait for more requests to predict together",
+                        type=float, default=BATCH_WINDOW)
+    parser.add_argument('--max-batch', help="Maximum number of texts predicted together", type=int,
+                        default=MAX_BATCH)
+    args = parser.parse_args()
+
+    try:
+        serve((args.host, args.port), args.batch_window, args.max_batch)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,317 @@
+"""
+Runs the classifier with NumPy only, without loading TensorFlow, which takes seconds and hundreds of MB per process.
+
+The weights of a trained model are exported from its .h5 file (which also contains the state of the optimizer) to a
+.npz file next to it. NumpyModel reads them and computes the same forward pass as Keras (Embedding, Bidirectional LSTM
+and Dense layers), on batches of padded sequences. The tokenizer saved by process_data.py (JSON) is also read without
+Keras by SavedTokenizer. predict_input.py uses both when the .npz file exists.
+
+Usage:
+    python3 numpy_model.py [models/<timestamp>_spam_classifier.h5]
+exports the weights of the model to models/<timestamp>_spam_classifier.npz, and checks that NumpyModel gives the same
+predictions as Keras.
+
+This module must not import TensorFlow, except to export the weights.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import numpy as np
+
+# Version of the format of the tokenizer written by process_data.save_tokenizer, changed when the format changes
+TOKENIZER_VERSION = 1
+# Exported weights of another version are not loaded
+WEIGHTS_VERSION = 1
+
+# Maximum number of time steps (sequences x words) computed at a time, which bounds the memory used by a batch
+PREDICT_BATCH_STEPS = 65536
+# Maximum difference between the probabilities predicted by NumpyModel and by Keras
+NUMPY_TOLERANCE = 1e-5
+
+
+def weights_path(model_path):
+    """
+    Returns:
+        The path of the weights exported from the model at <model_path>.
+    """
+    return os.path.splitext(model_path)[0] + '.npz'
+
+
+def pad_sequences(sequences, maxlen):
+    """
+    Pads sequences with 0 at the start, or truncates them at the start, to <maxlen> words, like the Keras function with
+    the same name (with the default arguments).
+
+    Args:
+        sequences (list): A list of sequences of word indexes.
+        maxlen (int): The length of the padded sequences.
+
+    Returns:
+        A numpy array of shape (number of sequences, maxlen).
+    """
+    padded = np.zeros((len(sequences), maxlen), dtype=np.int32)
+    for i, sequence in enumerate(sequences):
+        sequence = sequence[-maxlen:]
+        if len(sequence):
+            padded[i, -len(sequence):] = sequence
+    return padded
+
+
+class SavedTokenizer(object):
+    """
+    Tokenizer saved by process_data.save_tokenizer, converting texts to the same sequences as the Keras tokenizer.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path of the JSON file.
+
+        Raises:
+            ValueError: If the file was saved in another version of the format.
+        """
+        with open(path, encoding='utf-8') as fp:
+            artifact = json.load(fp)
+
+        if artifact.get('version') != TOKENIZER_VERSION:
+            raise ValueError(f"Unsupported tokenizer version {artifact.get('version')} in {path}, "
+                             f"expected version {TOKENIZER_VERSION}. Run process_data.py again.")
+
+        self.num_words = artifact['num_words']
+        self.lower = artifact['lower']
+        self.split = artifact['split']
+        self.char_level = artifact['char_level']
+        self.oov_token = artifact['oov_token']
+        self.word_index = artifact['word_index']
+        self.filters_table = str.maketrans({c: self.split for c in artifact['filters']})
+
+    def texts_to_sequences(self, texts):
+        """
+        Args:
+            texts (list): A list of text.
+
+        Returns:
+            A list of the sequence of word indexes of each text.
+        """
+        word_index = self.word_index
+        num_words = self.num_words
+        oov_index = word_index.get(self.oov_token)
+        sequences = []
+        for text in texts:
+            if self.lower:
+                text = text.lower()
+            if self.char_level:
+                words = text
+            else:
+                words = [word for word in text.translate(self.filters_table).split(self.split) if word]
+
+            sequence = []
+            for word in words:
+                index = word_index.get(word)
+                if index is not None and not (num_words and index >= num_words):
+                    sequence.append(index)
+                elif oov_index is not None:
+                    sequence.append(oov_index)
+            sequences.append(sequence)
+        return sequences
+
+
+def _sigmoid(x):
+    # Written with tanh, which does not overflow for large negative x
+    return 0.5 * (1 + np.tanh(0.5 * x))
+
+
+def _hard_sigmoid(x):
+    return np.clip(0.2 * x + 0.5, 0, 1)
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0),
+    'sigmoid': _sigmoid,
+    'hard_sigmoid': _hard_sigmoid,
+    'tanh': np.tanh
+}
+
+
+def export_weights(model_path, path=None):
+    """
+    Exports the weights of a trained Keras model to a .npz file, for NumpyModel.
+    Only the layers used by the classifier are supported: Embedding, Bidirectional LSTM (returning its last output,
+    concatenated), Dense and Dropout.
+
+    Args:
+        model_path (str): The path of the .h5 model.
+        path (str): The path of the .npz file, or None to save it next to the model.
+
+    Returns:
+        The path of the .npz file.
+
+    Raises:
+        ValueError: The model has a layer that is not supported.
+    """
+    from tensorflow.keras.models import load_model
+
+    model = load_model(model_path, compile=False)
+    layers = []
+    arrays = {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        config = layer.get_config()
+        name = str(len(layers))
+        if kind == 'Embedding':
+            arrays[name + '.embeddings'], = layer.get_weights()
+            layers.append({'type': 'embedding'})
+        elif kind == 'Bidirectional':
+            lstm_config = layer.forward_layer.get_config()
+            if (type(layer.forward_layer).__name__ != 'LSTM' or config['merge_mode'] != 'concat'
+                    or lstm_config['return_sequences'] or not lstm_config['use_bias']):
+                raise ValueError("Only Bidirectional(LSTM) layers returning their last output are supported.")
+            for direction, lstm in (('forward', layer.forward_layer), ('backward', layer.backward_layer)):
+                kernel, recurrent_kernel, bias = lstm.get_weights()
+                arrays[f'{name}.{direction}.kernel'] = kernel
+                arrays[f'{name}.{direction}.recurrent_kernel'] = recurrent_kernel
+                arrays[f'{name}.{direction}.bias'] = bias
+            layers.append({'type': 'bidirectional_lstm', 'activation': lstm_config['activation'],
+                           'recurrent_activation': lstm_config['recurrent_activation']})
+        elif kind == 'Dense':
+            arrays[name + '.kernel'], arrays[name + '.bias'] = layer.get_weights()
+            layers.append({'type': 'dense', 'activation': config['activation']})
+        elif kind == 'Dropout':
+            # Only used in training
+            continue
+        else:
+            raise ValueError(f"Unsupported layer {kind}.")
+
+    digest = hashlib.sha256()
+    with open(model_path, 'rb') as fp:
+        for block in iter(lambda: fp.read(1024 ** 2), b''):
+            digest.update(block)
+
+    config = {'version': WEIGHTS_VERSION, 'input_length': model.input_shape[1], 'layers': layers,
+              'model_sha256': digest.hexdigest()}
+    path = path or weights_path(model_path)
+    # Not compressed, as the weights hardly compress, and are loaded faster
+    np.savez(path, config=np.array(json.dumps(config)),
+             **{name: array.astype(np.float32) for name, array in arrays.items()})
+    return path
+
+
+class NumpyModel(object):
+    """
+    Forward pass of a classifier exported by export_weights, computed with NumPy.
+    Like a Keras model, predict takes a batch of padded sequences, which can be of any length.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str): The path of the .npz file saved by export_weights.
+
+        Raises:
+            ValueError: If the file was saved by another version.
+        """
+        with np.load(path) as weights:
+            config = json.loads(str(weights['config']))
+            if config.get('version') != WEIGHTS_VERSION:
+                raise ValueError(f"Unsupported weights version {config.get('version')} in {path}, "
+                                 f"expected version {WEIGHTS_VERSION}. Run numpy_model.py again.")
+            self.weights = {name: weights[name] for name in weights.files if name != 'config'}
+        self.input_length = config['input_length']
+        self.layers = config['layers']
+        # The SHA-256 hash of the .h5 file the weights were exported from
+        self.model_sha256 = config['model_sha256']
+
+    def _lstm(self, inputs, name, activation, recurrent_activation, go_backwards):
+        """
+        Returns:
+            The last output of an LSTM layer, for inputs of shape (batch, time steps, features).
+        """
+        kernel = self.weights[name + '.kernel']
+        recurrent_kernel = self.weights[name + '.recurrent_kernel']
+        units = recurrent_kernel.shape[0]
+
+        # The inputs of every time step are multiplied at once, the recurrent state is then updated step by step.
+        # The gates are in the Keras order: input, forget, cell, output.
+        projected = inputs @ kernel + self.weights[name + '.bias']
+        h = np.zeros((inputs.shape[0], units), dtype=np.float32)
+        c = np.zeros((inputs.shape[0], units), dtype=np.float32)
+        steps = range(inputs.shape[1] - 1, -1, -1) if go_backwards else range(inputs.shape[1])
+        for t in steps:
+            z = projected[:, t] + h @ recurrent_kernel
+            i = recurrent_activation(z[:, :units])
+            f = recurrent_activation(z[:, units:2 * units])
+            o = recurrent_activation(z[:, 3 * units:])
+            c = f * c + i * activation(z[:, 2 * units:3 * units])
+            h = o * activation(c)
+        return h
+
+    def _forward(self, x):
+        outputs = x
+        for i, layer in enumerate(self.layers):
+            name = str(i)
+            if layer['type'] == 'embedding':
+                outputs = self.weights[name + '.embeddings'][outputs]
+            elif layer['type'] == 'bidirectional_lstm':
+                activation = ACTIVATIONS[layer['activation']]
+                recurrent_activation = ACTIVATIONS[layer['recurrent_activation']]
+                outputs = np.concatenate([
+                    self._lstm(outputs, name + '.forward', activation, recurrent_activation, go_backwards=False),
+                    self._lstm(outputs, name + '.backward', activation, recurrent_activation, go_backwards=True)
+                ], axis=1)
+            elif layer['type'] == 'dense':
+                outputs = ACTIVATIONS[layer['activation']](
+                    outputs @ self.weights[name + '.kernel'] + self.weights[name + '.bias'])
+        return outputs
+
+    def predict(self, x):
+        """
+        Args:
+            x (numpy.ndarray): Padded sequences of word indexes, of shape (batch, time steps).
+
+        Returns:
+            A numpy array of the outputs of the model, of shape (batch, 1).
+        """
+        x = np.asarray(x)
+        batch_size = max(1, PREDICT_BATCH_STEPS // max(1, x.shape[1]))
+        return np.concatenate([self._forward(x[start:start + batch_size])
+                               for start in range(0, len(x), batch_size)] or [np.zeros((0, 1), np.float32)])
+
+
+def compare_with_keras(model_path, path=None, tolerance=NUMPY_TOLERANCE, samples=64):
+    """
+    Checks that NumpyModel predicts the same probabilities as Keras, on random sequences of random lengths.
+
+    Args:
+        model_path (str): The path of the .h5 model.
+        path (str): The path of the exported weights, or None if they are next to the model.
+        tolerance (float): The maximum difference between the probabilities.
+        samples (int): The number of random sequences.
+
+    Returns:
+        The maximum difference between the probabilities.
+    """
+    from tensorflow.keras.models import load_model
+
+    model = load_model(model_path, compile=False)
+    numpy_model = NumpyModel(path or weights_path(model_path))
+    vocabulary = next(array.shape[0] for name, array in numpy_model.weights.items() if name.endswith('.embeddings'))
+
+    rng = np.random.default_rng(0)
+    sequences = [rng.integers(1, vocabulary, size=length).tolist()
+                 for length in rng.integers(0, numpy_model.input_length + 100, size=samples)]
+    x = pad_sequences(sequences, numpy_model.input_length)
+
+    difference = float(np.abs(numpy_model.predict(x) - model.predict(x)).max())
+    assert difference <= tolerance, f"NumpyModel predictions differ by {difference} (tolerance {tolerance})"
+    print(f"NumpyModel predictions match Keras (maximum difference {difference:.2e})")
+    return difference
+
+
+if __name__ == '__main__':
+    model_path = sys.argv[1] if len(sys.argv) > 1 else \
+        os.path.dirname(os.path.abspath(__file__)) + '/models/20200925163152_spam_classifier.h5'
+    print("Exported weights to", export_weights(model_path))
+    compare_with_keras(model_path)
@@ -1,69 +1,330 @@
 """
 Predicts whether emails are spam, using a loaded model. Allows integration of the model into the Dash application.
+
+If the weights of the model have been exported with numpy_model.py, the model is run with NumPy, and TensorFlow is not
+loaded. Otherwise, the Keras model is loaded.
 """
 
-from tensorflow.keras.models import save_model, load_model
+import hashlib
+import os
 import pandas as pd
 import numpy as np
-import string
-import re
-import os
-from keras.preprocessing.text import Tokenizer
-from keras.preprocessing.sequence import pad_sequences
-from process_data import tokenizer
+from cache import LRUCache
+from numpy_model import NumpyModel, SavedTokenizer, pad_sequences, weights_path
+from preprocessing import clean_texts
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
 DATA_DIR = 'data/'
 
 MODEL_PATH = os.path.dirname(os.path.abspath(__file__)) + '/models/20200925163152_spam_classifier.h5'
+# The tokenizer is saved next to the model by exec.py
+TOKENIZER_PATH = MODEL_PATH.replace('_spam_classifier.h5', '_tokenizer.json')
+# The weights of the model exported by numpy_model.py, used instead of the Keras model if they exist
+WEIGHTS_PATH = weights_path(MODEL_PATH)
 DATASET = os.path.dirname(os.path.abspath(__file__)) + "/emails.csv"
 
 EMBED_SIZE = 100 # word vector size
 MAX_FEATURE = 50000 # number of unique words
 MAX_LEN = 2000 # maximum number of words to use
 
+# Inputs are grouped by their number of words, and each group is padded to the smallest bucket length that leaves at
+# least BUCKET_PAD_MARGIN padding words, instead of MAX_LEN. The forward LSTM reads the padding before the email, and
+# its state converges after a few padding words. The backward LSTM reads the padding after the email, so the
+# predictions only stay the same if its state also settles on the padding, which depends on the weights of the model.
+# This is checked on BUCKET_CHECK_SAMPLES random sequences when the model is loaded, and the model is padded to MAX_LEN
+# if the predictions differ by more than BUCKET_TOLERANCE.
+BUCKET_LENGTHS = (128, 256, 512, 1024, MAX_LEN)
+BUCKET_PAD_MARGIN = 64
+BUCKET_TOLERANCE = 1e-4
+BUCKET_CHECK_SAMPLES = 16
+
+# Probabilities predicted for each cleaned text, as the same emails (e.g. spam campaigns) are often predicted again
+PREDICTION_CACHE_MAX_ENTRIES = 100000
+PREDICTION_CACHE_TTL = 24 * 60 * 60  # 1 day
+PREDICTION_CACHE = LRUCache(max_entries=PREDICTION_CACHE_MAX_ENTRIES, sizeof=lambda probability: 0,
+                            ttl=PREDICTION_CACHE_TTL)
+
 ### HELPER FUNCTIONS ###
 
-def remove_hyperlinks(word):
-    """Removes hyperlinks from a word"""
-    return re.sub(r"http\S+", "", word)
+def get_tokenizer(path=TOKENIZER_PATH):
+    """
+    Loads the tokenizer saved next to the model.
+    Models trained before the tokenizer was saved have no tokenizer file, so the tokenizer is fitted on the dataset
+    again (as it was when the model was trained) and saved, so that this is only done once.
 
+    Args:
+        path (str): The path of the saved tokenizer.
 
-def lower(word):
-    """Sets all characters in a word to their lowercase value"""
-    return word.lower()
+    Returns:
+        A tokenizer, with the texts_to_sequences method of the Keras tokenizer.
+    """
+    if os.path.exists(path):
+        return SavedTokenizer(path)
 
+    from process_data import load_dataset, fit_tokenizer, save_tokenizer
+    print(f'[WARNING] {path} not found, fitting the tokenizer on the dataset.')
+    x_train, _, _, _ = load_dataset()
+    tokenizer = fit_tokenizer(x_train)
+    save_tokenizer(tokenizer, path)
+    return tokenizer
 
-def remove_numbers(word):
-    """Removes all numbers from word"""
-    return re.sub(r"\d+", '', word)
 
+def bucket_length(length):
+    """
+    Returns:
+        The length to pad a sequence of <length> words to.
+    """
+    for bucket in BUCKET_LENGTHS:
+        if length + BUCKET_PAD_MARGIN <= bucket:
+            return bucket
+    return MAX_LEN
 
-def remove_punctuation(word):
-    """Removes all punctuation from word"""
-    return word.translate(str.maketrans(dict.fromkeys(string.punctuation)))
 
+_variable_length_models = {}
 
-def remove_whitespace(word):
-    """Removes whitespace from word"""
-    return word.strip()
+def variable_length_model(model):
+    """
+    Copies a model built for inputs of MAX_LEN words, so that it accepts inputs of any length.
+    The copy is made once for each model.
+
+    Args:
+        model: A Sequential model.
+
+    Returns:
+        A Sequential model with the same layers and weights, and a variable input length.
+    """
+    if isinstance(model, NumpyModel):
+        # Accepts inputs of any length already
+        return model
+
+    if id(model) not in _variable_length_models:
+        from tensorflow.keras.models import Sequential
+
+        config = model.get_config()
+        for layer in config['layers']:
+            if 'batch_input_shape' in layer['config']:
+                layer['config']['batch_input_shape'] = (None, None)
+            if 'input_length' in layer['config']:
+                layer['config']['input_length'] = None
+        copy = Sequential.from_config(config)
+        copy.set_weights(model.get_weights())
+        _variable_length_models[id(model)] = (model, copy)
+    return _variable_length_models[id(model)][1]
+
+
+_bucketing_checks = {}
+
+def bucketing_difference(model, samples=BUCKET_CHECK_SAMPLES):
+    """
+    Compares the predictions of <model> for random sequences padded to their bucket length and padded to MAX_LEN.
+    The sequences have the lengths with the least and the most padding in each bucket.
+
+    Args:
+        model: A model to check.
+        samples (int): The number of random sequences.
+
+    Returns:
+        The maximum difference between the probabilities.
+    """
+    if isinstance(model, NumpyModel):
+        vocabulary = next(array.shape[0] for name, array in model.weights.items() if name.endswith('.embeddings'))
+    else:
+        vocabulary = model.layers[0].input_dim
 
+    lengths = []
+    previous = 0
+    for bucket in BUCKET_LENGTHS[:-1]:
+        lengths += [previous + 1 - BUCKET_PAD_MARGIN if previous else 1, bucket - BUCKET_PAD_MARGIN]
+        previous = bucket
+    rng = np.random.default_rng(0)
+    sequences = [rng.integers(1, vocabulary, size=lengths[i % len(lengths)]).tolist() for i in range(samples)]
 
-def remove_newline(word):
-    """Removes newline from word"""
-    return word.replace('\n', '')
+    expected = predict_sequences(sequences, model, bucketed=False)
+    probabilities = predict_sequences(sequences, model, bucketed=True, checked=False)
+    return float(np.abs(probabilities - expected).max())
 
 
-def clean_pipeline(sentence):
-    """Apply cleaning functions in sequential order to an input sentence"""
-    clean_utils = (remove_hyperlinks, remove_newline, lower, remove_numbers, remove_punctuation, remove_whitespace)
-    for func in clean_utils:
-        sentence = func(sentence)
-    return sentence
+def bucketing_enabled(model):
+    """
+    Checks once for each model that bucketing does not change its predictions by more than BUCKET_TOLERANCE.
+
+    Returns:
+        True if the inputs of <model> can be padded to their bucket length, False if they must be padded to MAX_LEN.
+    """
+    if id(model) not in _bucketing_checks:
+        difference = bucketing_difference(model)
+        enabled = difference <= BUCKET_TOLERANCE
+        if not enabled:
+            print(f'[WARNING] Bucketed predictions differ by {difference:.2e} (tolerance {BUCKET_TOLERANCE}), '
+                  f'padding inputs to {MAX_LEN} words.')
+        _bucketing_checks[id(model)] = (model, enabled)
+    return _bucketing_checks[id(model)][1]
+
+
+_model_versions = {}
+
+def model_version(path):
+    """
+    Returns:
+        The SHA-256 hash (hex string) of the model file at <path>, which identifies the model in the prediction cache.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(1024 ** 2), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_classifier(path=MODEL_PATH):
+    """
+    Loads a model, and records its version, so that its predictions are cached.
+    The version is the hash of the model file, so the cached predictions are not used when the model at MODEL_PATH
+    changes, or when MODEL_PATH is changed.
+
+    Args:
+        path (str): The path of the saved model (.h5), or of its exported weights (.npz).
+
+    Returns:
+        The model, a NumpyModel for exported weights.
+    """
+    version = model_version(path)
+    if path.endswith('.npz'):
+        model = NumpyModel(path)
+    else:
+        from tensorflow.keras.models import load_model
+        model = load_model(path, compile = True)
+    _model_versions[id(model)] = (model, version)
+    return model
+
+
+def classifier_version(model):
+    """
+    Returns:
+        The version of a model loaded with load_classifier (the hash of the file it was loaded from), or None.
+    """
+    return _model_versions.get(id(model), (None, None))[1]
+
+
+def cache_key(version, cleaned_text):
+    """
+    Returns:
+        The key of the probability predicted by the model with <version> for <cleaned_text> in PREDICTION_CACHE.
+    """
+    digest = hashlib.sha256(version.encode('ascii'))
+    digest.update(b'\0')
+    digest.update(cleaned_text.encode('utf-8', 'surrogatepass'))
+    return digest.digest()
+
+
+def prediction_cache_stats():
+    """
+    Returns:
+        A dictionary of the statistics of PREDICTION_CACHE (hits, misses, hit_rate...).
+    """
+    return PREDICTION_CACHE.stats()
+
+
+def load_default_classifier():
+    """
+    Loads the exported weights of the model at MODEL_PATH if they exist (the model file itself is then not needed), or
+    the Keras model otherwise, or if the weights were exported from another model.
+
+    Returns:
+        The model.
+    """
+    if os.path.exists(WEIGHTS_PATH):
+        model = load_classifier(WEIGHTS_PATH)
+        if not os.path.exists(MODEL_PATH) or model.model_sha256 == model_version(MODEL_PATH):
+            return model
+        print(f'[WARNING] {WEIGHTS_PATH} was exported from another model, run numpy_model.py again.')
+    return load_classifier(MODEL_PATH)
+
 
 ### END HELPER FUNCTIONS ###
-MODEL = load_model(MODEL_PATH, compile = True)
+MODEL = load_default_classifier()
+tokenizer = get_tokenizer()
+
+def predict_probabilities(text, model, bucketed=True, cached=True):
+    """
+    Predicts the probability that each text is spam.
+    The probabilities are cached for the models loaded with load_classifier, by the hash of the cleaned text.
+
+    Args:
+        text (list): A list of text to predict.
+        model: A model to use.
+        bucketed (bool): Whether to pad the texts to their bucket length, or to MAX_LEN.
+        cached (bool): Whether to use the prediction cache.
+
+    Returns:
+        A numpy array of the probability of each text, in order.
+    """
+    cleaned_texts = clean_texts(text)
+    version = classifier_version(model)
+    if not cached or version is None:
+        return predict_cleaned(cleaned_texts, model, bucketed)
+
+    probabilities = np.zeros(len(cleaned_texts), dtype=np.float32)
+    missing = {}  # key --> positions of the texts that are not cached
+    for i, cleaned_text in enumerate(cleaned_texts):
+        key = cache_key(version, cleaned_text)
+        probability = PREDICTION_CACHE.get(key)
+        if probability is None:
+            missing.setdefault(key, []).append(i)
+        else:
+            probabilities[i] = probability
+
+    if missing:
+        # The same text is only predicted once, even if it is repeated in <text>
+        predicted = predict_cleaned([cleaned_texts[positions[0]] for positions in missing.values()], model, bucketed)
+        for (key, positions), probability in zip(missing.items(), predicted):
+            probabilities[positions] = probability
+            PREDICTION_CACHE.put(key, float(probability))
+    return probabilities
+
+
+def predict_cleaned(cleaned_texts, model, bucketed=True):
+    """
+    Predicts the probability that each cleaned text is spam, without the prediction cache.
+
+    Args:
+        cleaned_texts (list): A list of text cleaned with clean_texts.
+        model: A model to use.
+        bucketed (bool): Whether to pad the texts to their bucket length, or to MAX_LEN.
+
+    Returns:
+        A numpy array of the probability of each text, in order.
+    """
+    return predict_sequences(tokenizer.texts_to_sequences(cleaned_texts), model, bucketed)
+
+
+def predict_sequences(sequences, model, bucketed=True, checked=True):
+    """
+    Predicts the probability that each tokenized text is spam, without the prediction cache.
+
+    Args:
+        sequences (list): A list of sequences of word indexes, returned by tokenizer.texts_to_sequences.
+        model: A model to use.
+        bucketed (bool): Whether to pad the sequences to their bucket length, or to MAX_LEN.
+        checked (bool): Whether to pad the sequences to MAX_LEN anyway if bucketing changes the predictions of <model>.
+
+    Returns:
+        A numpy array of the probability of each sequence, in order.
+    """
+    if not bucketed or (checked and not bucketing_enabled(model)):
+        return model.predict(pad_sequences(sequences, maxlen=MAX_LEN))[:, 0]
+
+    buckets = {}
+    for i, sequence in enumerate(sequences):
+        buckets.setdefault(bucket_length(len(sequence)), []).append(i)
+
+    probabilities = np.zeros(len(sequences), dtype=np.float32)
+    bucket_model = variable_length_model(model)
+    for length, indexes in buckets.items():
+        x_features = pad_sequences([sequences[i] for i in indexes], maxlen=length)
+        probabilities[indexes] = bucket_model.predict(x_features)[:, 0]
+    return probabilities
+
 
 def predict(text, model):
     """
@@ -76,17 +337,36 @@ def predict(text, model):
     Returns:
         A list of predictions
     """
-    cleaned_text_array = np.array([clean_pipeline(sentence) for sentence in text])
+    predictions = predict_probabilities(text, model)
+    predictions = [0 if output < 0.5 else 1 for output in predictions]
 
-    x = cleaned_text_array
+    return predictions
 
-    x_features = pad_sequences(np.array(tokenizer.texts_to_sequences(x)), maxlen=MAX_LEN)
 
-    predictions = model.predict(x_features)
-    predictions = [0 if output < 0.5 else 1 for output in predictions]
+def check_bucketing(text, model, tolerance=BUCKET_TOLERANCE):
+    """
+    Checks that padding the texts to their bucket length gives the same predictions as padding them to MAX_LEN.
+    Unlike the check made when the model is loaded, real emails are used.
+
+    Args:
+        text (list): A list of text to predict.
+        model: A model to use.
+        tolerance (float): The maximum difference between the probabilities.
+
+    Returns:
+        The maximum difference between the probabilities.
+    """
+    expected = predict_probabilities(text, model, bucketed=False, cached=False)
+    sequences = tokenizer.texts_to_sequences(clean_texts(text))
+    probabilities = predict_sequences(sequences, model, checked=False)
+    difference = float(np.abs(probabilities - expected).max()) if len(expected) else 0.0
+    assert difference <= tolerance, f"Bucketed predictions differ by {difference} (tolerance {tolerance})"
+    print(f"Bucketed predictions match (maximum difference {difference:.2e})")
+    return difference
 
-    return predictions
 
+# Checked when the model is loaded, instead of on the first prediction
+bucketing_enabled(MODEL)
 
 if __name__ == '__main__':
 
@@ -94,5 +374,7 @@ if __name__ == '__main__':
     data = pd.read_csv(DATASET)
     text = data['text']
 
+    check_bucketing(text, MODEL)
     predictions = predict(text, MODEL)
     print(predictions)
+    print("Prediction cache:", prediction_cache_stats())
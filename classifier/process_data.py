@@ -6,92 +6,97 @@ architecture to effectively extract relationships between the sequence data and
 
 import pandas as pd
 import numpy as np
-import string
-import re
+import json
 import os
 from keras.preprocessing.text import Tokenizer
 from keras.preprocessing.sequence import pad_sequences
+from numpy_model import TOKENIZER_VERSION
+from preprocessing import clean_texts
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 DATASET = os.path.dirname(os.path.abspath(__file__)) + "/emails.csv"
 
-data = pd.read_csv(DATASET)
-
-text = data['text']
-labels = data['spam']
-labels_array = np.array(labels)
-
-DATASET_SIZE = labels_array.shape[0]
-
 DATA_DIR = 'data/'
+TOKENIZER_FILENAME = 'tokenizer.json'
 
 EMBED_SIZE = 100 # word vector size
 MAX_FEATURE = 50000 # number of unique words
 MAX_LEN = 2000 # maximum number of words to use
 
-### HELPER FUNCTIONS ###
-
-def remove_hyperlinks(word):
-    """Removes hyperlinks from a word"""
-    return re.sub(r"http\S+", "", word)
-
-
-def lower(word):
-    """Sets all characters in a word to their lowercase value"""
-    return word.lower()
-
-
-def remove_numbers(word):
-    """Removes all numbers from word"""
-    return re.sub(r"\d+", '', word)
 
+def load_dataset(dataset=DATASET):
+    """
+    Reads the dataset, and cleans the text of every email.
 
-def remove_punctuation(word):
-    """Removes all punctuation from word"""
-    return word.translate(str.maketrans(dict.fromkeys(string.punctuation)))
+    Returns:
+        (x_train, x_test, y_train, y_test), the cleaned texts and labels, split 80/20 into training and test data.
+    """
+    data = pd.read_csv(dataset)
 
+    text = data['text']
+    labels = data['spam']
+    labels_array = np.array(labels)
 
-def remove_whitespace(word):
-    """Removes whitespace from word"""
-    return word.strip()
+    dataset_size = labels_array.shape[0]
 
+    cleaned_text_array = np.array(clean_texts(text))
+    assert cleaned_text_array.shape == labels_array.shape
 
-def remove_newline(word):
-    """Removes newline from word"""
-    return word.replace('\n', '')
+    x_train, x_test = cleaned_text_array[:int(0.8 * dataset_size)], cleaned_text_array[int(0.8 * dataset_size):]
+    y_train, y_test = labels_array[:int(0.8 * dataset_size)], labels_array[int(0.8 * dataset_size):]
+    return x_train, x_test, y_train, y_test
 
 
-def clean_pipeline(sentence):
-    """Apply cleaning functions in sequential order to an input sentence"""
-    clean_utils = (remove_hyperlinks, remove_newline, lower, remove_numbers, remove_punctuation, remove_whitespace)
-    for func in clean_utils:
-        sentence = func(sentence)
-    return sentence
+def fit_tokenizer(x_train):
+    """Fits the tokenizer on the cleaned training texts"""
+    tokenizer = Tokenizer(num_words=MAX_FEATURE)
+    tokenizer.fit_on_texts(x_train)
+    return tokenizer
 
-### END HELPER FUNCTIONS ###
 
-cleaned_text_array = np.array([clean_pipeline(sentence) for sentence in text])
-assert cleaned_text_array.shape == labels_array.shape
+def save_tokenizer(tokenizer, path):
+    """
+    Saves the vocabulary and settings of a fitted tokenizer as JSON, so that predictions do not need to fit it again.
+    Only the words kept by the tokenizer (the MAX_FEATURE most frequent words) are saved.
 
-x_train, x_test = cleaned_text_array[:int(0.8 * DATASET_SIZE)], cleaned_text_array[int(0.8 * DATASET_SIZE):]
-y_train, y_test = labels_array[:int(0.8 * DATASET_SIZE)], labels_array[int(0.8 * DATASET_SIZE):]
-
-tokenizer = Tokenizer(num_words=MAX_FEATURE)
-
-tokenizer.fit_on_texts(x_train)
-
-x_train_features = pad_sequences(np.array(tokenizer.texts_to_sequences(x_train)), maxlen=MAX_LEN)
-x_test_features = pad_sequences(np.array(tokenizer.texts_to_sequences(x_test)), maxlen=MAX_LEN)
+    Args:
+        tokenizer: A fitted Keras tokenizer.
+        path (str): The path of the JSON file.
+    """
+    word_index = {word: index for word, index in tokenizer.word_index.items()
+                  if not tokenizer.num_words or index < tokenizer.num_words}
+    artifact = {
+        'version': TOKENIZER_VERSION,
+        'num_words': tokenizer.num_words,
+        'filters': tokenizer.filters,
+        'lower': tokenizer.lower,
+        'split': tokenizer.split,
+        'char_level': tokenizer.char_level,
+        'oov_token': tokenizer.oov_token,
+        'word_index': word_index
+    }
+    with open(path, 'w', encoding='utf-8') as fp:
+        json.dump(artifact, fp, ensure_ascii=False)
 
 
 if __name__ == '__main__':
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
 
+    x_train, x_test, y_train, y_test = load_dataset()
+
+    tokenizer = fit_tokenizer(x_train)
+
+    x_train_features = pad_sequences(np.array(tokenizer.texts_to_sequences(x_train)), maxlen=MAX_LEN)
+    x_test_features = pad_sequences(np.array(tokenizer.texts_to_sequences(x_test)), maxlen=MAX_LEN)
+
     mapping = {'x_train': x_train_features, 'x_test': x_test_features, 'y_train': y_train, 'y_test': y_test}
 
     for name, variable in mapping.items():
         print(f'{name} shape: {variable.shape}')
         np.save(f'{DATA_DIR}{name}.npy', variable)
-    
-    print(f'All data arrays saved to {DATA_DIR}')
+
+    # The model trained on these arrays must use the same tokenizer, exec.py saves it next to the model
+    save_tokenizer(tokenizer, f'{DATA_DIR}{TOKENIZER_FILENAME}')
+
+    print(f'All data arrays and the tokenizer saved to {DATA_DIR}')
@@ -0,0 +1,198 @@
+"""
+REST API to classify emails in bulk, outside of the Dash callbacks.
+
+POST /api/classify accepts a batch of emails, either as a JSON array, or as NDJSON (one JSON value per line, sent with
+the Content-Type application/x-ndjson). Each email is a string, or an object {"text": ..., "id": ...}. The result of
+each email is streamed back as a line of NDJSON, in the order of the emails, as soon as it is ready:
+    {"id": <id, or the position of the email>, "label": "spam" | "ham", "probability": <probability of spam>}
+
+NDJSON is read and classified in chunks of CLASSIFY_CHUNK_SIZE emails, so the memory used does not depend on the number
+of emails, and the next chunks are classified while the results of the previous ones are sent. The emails are cleaned,
+tokenized and predicted by the inference server (see classifier/inference_server.py), which batches them with the other
+requests.
+
+Usage:
+    curl -H "Content-Type: application/x-ndjson" --data-binary @emails.ndjson http://127.0.0.1:8050/api/classify
+"""
+
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from app import server
+from callbacks import INFERENCE
+from flask import Response, request, jsonify, stream_with_context
+
+# Number of emails sent to the inference server at a time
+CLASSIFY_CHUNK_SIZE = 256
+# Number of chunks of a request being classified at the same time
+CLASSIFY_IN_FLIGHT = 4
+# Maximum size of a JSON array, which is read in memory at once. Larger batches must be sent as NDJSON.
+CLASSIFY_MAX_JSON_BYTES = 16 * 1024 ** 2  # 16 MB
+
+CLASSIFY_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix='classify')
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+
+def parse_email(value, position):
+    """
+    Reads an email of a batch.
+
+    Args:
+        value: A string, or a dictionary {'text', 'id' (optional)}.
+        position (int): The position of the email in the batch, used as its ID by default.
+
+    Returns:
+        (id, text) of the email.
+
+    Raises:
+        ValueError: The email has no text.
+    """
+    if isinstance(value, str):
+        return position, value
+    if isinstance(value, dict) and isinstance(value.get('text'), str):
+        return value.get('id', position), value['text']
+    raise ValueError("Each email must be a string or an object with a 'text' string.")
+
+
+def read_ndjson(stream):
+    """
+    Reads the emails of an NDJSON request body, one line at a time.
+
+    Args:
+        stream: The request body.
+
+    Yields:
+        (id, text, error) of each email, where error is the reason the line could not be read, or None.
+    """
+    position = 0
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            email_id, text = parse_email(json.loads(line.decode('utf-8')), position)
+            yield email_id, text, None
+        except ValueError as e:
+            # json.JSONDecodeError and UnicodeDecodeError are ValueErrors too
+            yield position, None, str(e)
+        position += 1
+
+
+def read_json(body):
+    """
+    Reads the emails of a JSON request body.
+
+    Args:
+        body (bytes): A JSON array of emails.
+
+    Returns:
+        An iterator of (id, text, error) of each email, where error is the reason the email could not be read, or None.
+
+    Raises:
+        ValueError: The body is not a JSON array.
+    """
+    emails = json.loads(body.decode('utf-8'))
+    if not isinstance(emails, list):
+        raise ValueError("The request body must be a JSON array of emails.")
+
+    def emails_of_body():
+        for position, value in enumerate(emails):
+            try:
+                email_id, text = parse_email(value, position)
+                yield email_id, text, None
+            except ValueError as e:
+                yield position, None, str(e)
+
+    return emails_of_body()
+
+
+def chunks(emails, size=CLASSIFY_CHUNK_SIZE):
+    """
+    Groups emails in chunks of <size> emails.
+
+    Yields:
+        Lists of (id, text, error).
+    """
+    chunk = []
+    for email in emails:
+        chunk.append(email)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def classify_chunk(chunk):
+    """
+    Classifies a chunk of emails with the inference server.
+
+    Args:
+        chunk (list): A list of (id, text, error).
+
+    Returns:
+        The list of results (dictionaries) of the emails.
+    """
+    probabilities = iter(INFERENCE.predict_probabilities([text for _, text, error in chunk if error is None]))
+    results = []
+    for email_id, _, error in chunk:
+        if error is not None:
+            results.append({'id': email_id, 'error': error})
+            continue
+        probability = next(probabilities)
+        results.append({'id': email_id, 'label': 'spam' if probability >= 0.5 else 'ham',
+                        'probability': probability})
+    return results
+
+
+def classify_stream(emails):
+    """
+    Classifies emails chunk by chunk, with up to CLASSIFY_IN_FLIGHT chunks classified at the same time.
+
+    Args:
+        emails (iterable): (id, text, error) of each email.
+
+    Yields:
+        The results of the emails, as lines of NDJSON, in order.
+    """
+    pending = deque()
+    try:
+        for chunk in chunks(emails):
+            pending.append(CLASSIFY_EXECUTOR.submit(classify_chunk, chunk))
+            # Waits for the oldest chunk before reading more, so only CLASSIFY_IN_FLIGHT chunks are held in memory
+            if len(pending) >= CLASSIFY_IN_FLIGHT:
+                yield ''.join(json.dumps(result) + '\n' for result in pending.popleft().result())
+        while pending:
+            yield ''.join(json.dumps(result) + '\n' for result in pending.popleft().result())
+    except Exception as e:
+        print("[WARNING] Unable to classify emails:", e)
+        # The status has already been sent, so the error is reported as the last line
+        yield json.dumps({'error': 'Unable to classify emails: {}'.format(e)}) + '\n'
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+@server.route('/api/classify', methods=['POST'])
+def classify():
+    """
+    Classifies a JSON or NDJSON batch of emails, streaming the results as NDJSON.
+    """
+    if not INFERENCE.is_running():
+        return jsonify(error='The classifier is not available.'), 503
+
+    if request.mimetype == NDJSON_MIMETYPE:
+        emails = read_ndjson(request.stream)
+    else:
+        # Reads one byte more than the limit, to know if the body is larger than the limit
+        body = request.stream.read(CLASSIFY_MAX_JSON_BYTES + 1)
+        if len(body) > CLASSIFY_MAX_JSON_BYTES:
+            return jsonify(error='JSON batches are limited to {} bytes, send larger batches as NDJSON ({}).'.format(
+                CLASSIFY_MAX_JSON_BYTES, NDJSON_MIMETYPE)), 413
+        try:
+            emails = read_json(body)
+        except ValueError as e:
+            return jsonify(error=str(e)), 400
+
+    return Response(stream_with_context(classify_stream(emails)), mimetype=NDJSON_MIMETYPE)
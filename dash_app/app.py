@@ -23,3 +23,4 @@ app.config['suppress_callback_exceptions'] = True
 # Initialize, routes, layouts and callbacks
 import routes
 import callbacks
+import api
@@ -0,0 +1,91 @@
+// Uploads the dataset selected or dropped in the #upload-large box to the /upload route. The File is posted as the
+// request body, which the browser streams from disk, so the file is never read into the page, and the server saves the
+// progress of the upload before receiving it. The callbacks are told that an upload started or failed by clicking the
+// hidden #upload-large-notify button, and read the state of the upload with dash_clientside.uploads.upload_state.
+(function () {
+    var state = {started: null, error: null};
+
+    function notify() {
+        var button = document.getElementById('upload-large-notify');
+        if (button) {
+            button.click();
+        }
+    }
+
+    function fail(error) {
+        state = {started: state.started, error: error};
+        notify();
+    }
+
+    function post(file) {
+        state = {started: Date.now(), error: null};
+        if (!/\.csv$/i.test(file.name)) {
+            fail('Please upload a .csv file.');
+            return;
+        }
+        notify();
+
+        var session_id = document.getElementById('upload-large-session').textContent;
+        var url = '/upload?session=' + encodeURIComponent(session_id) + '&filename=' + encodeURIComponent(file.name);
+        fetch(url, {method: 'POST', headers: {'Content-Type': 'text/csv'}, body: file}).then(function (response) {
+            if (!response.ok) {
+                return response.json().then(function (body) {
+                    fail(body.error || 'Unable to upload the file.');
+                }, function () {
+                    fail('Unable to upload the file (HTTP ' + response.status + ').');
+                });
+            }
+        }).catch(function () {
+            fail('Unable to upload the file, please check your connection.');
+        });
+    }
+
+    function inBox(event) {
+        return event.target.closest && event.target.closest('#upload-large');
+    }
+
+    // The box is rendered by Dash, possibly after this script runs, so the events are handled on the document
+    document.addEventListener('click', function (event) {
+        if (!event.target.closest || !event.target.closest('#upload-large-select')) {
+            return;
+        }
+        var input = document.createElement('input');
+        input.type = 'file';
+        input.accept = '.csv';
+        input.addEventListener('change', function () {
+            if (input.files.length) {
+                post(input.files[0]);
+            }
+        });
+        input.click();
+    });
+
+    document.addEventListener('dragover', function (event) {
+        if (inBox(event)) {
+            event.preventDefault();
+        }
+    });
+
+    document.addEventListener('drop', function (event) {
+        if (inBox(event)) {
+            event.preventDefault();
+            if (event.dataTransfer.files.length) {
+                post(event.dataTransfer.files[0]);
+            }
+        }
+    });
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        uploads: {
+            session: function (session_id) {
+                return session_id;
+            },
+            upload_state: function (n_clicks) {
+                if (!n_clicks) {
+                    return window.dash_clientside.no_update;
+                }
+                return {started: state.started, error: state.error};
+            }
+        }
+    });
+})();
@@ -4,27 +4,209 @@ Implementation of the Boyer-Moore substring search algorithm, as well as the nai
 Boyer-Moore's approach is to try to match the last character of the pattern instead of the first one with the 
 assumption that if there's no match at the end, no need to try to match at the beginning. This allows for "big jumps" 
 therefore BM works better when the pattern and the text you are searching resemble "natural text" (i.e. English)
+
+To search for several patterns at once, the Aho-Corasick algorithm is also implemented. It builds an automaton from all
+the patterns, and finds every occurrence of every pattern in a single pass over the text.
 """
 
+from collections import deque
+
+
+class BoyerMoorePattern(object):
+    """
+    A pattern compiled for the Boyer-Moore algorithm, using both the bad character rule and the good suffix rule.
+
+    The tables only depend on the pattern, so they are computed once and the compiled pattern can be reused to search
+    any number of texts. The precomputation time complexity is O(m).
+    """
+
+    def __init__(self, pattern):
+        """
+        Compiles <pattern>.
+
+        Args:
+            pattern (str): A pattern to find.
+        """
+        self.pattern = pattern
+        self.bad_character = self._bad_character_table(pattern)
+        self.good_suffix = self._good_suffix_table(pattern)
+
+    @staticmethod
+    def _bad_character_table(pattern):
+        """Generate a dictionary with the last occurrence of each letter inside the pattern.
+        Letters that are not in the pattern are left out (their last occurrence is -1)."""
+        return {letter: i for i, letter in enumerate(pattern)}
+
+    @staticmethod
+    def _good_suffix_table(pattern):
+        """
+        Generate the (strong) good suffix shift table.
+
+        shift[j + 1] is how far the pattern can be shifted when pattern[j] mismatches after pattern[j+1:] has
+        matched, and shift[0] is how far it can be shifted after a full match.
+        """
+        m = len(pattern)
+        shift = [0] * (m + 1)
+        border = [0] * (m + 1)  # border[i] is the start of the widest border of pattern[i:]
+
+        # Case 1: the matched suffix occurs somewhere else in the pattern
+        i = m
+        j = m + 1
+        border[i] = j
+        while i > 0:
+            while j <= m and pattern[i - 1] != pattern[j - 1]:
+                if shift[j] == 0:
+                    shift[j] = j - i
+                j = border[j]
+            i -= 1
+            j -= 1
+            border[i] = j
 
-class last_occurrence(object):
-    """Last occurrence functor."""
+        # Case 2: only a part of the matched suffix occurs as a prefix of the pattern
+        j = border[0]
+        for i in range(m + 1):
+            if shift[i] == 0:
+                shift[i] = j
+            if i == j:
+                j = border[j]
 
-    def __init__(self, pattern, alphabet):
-        """Generate a dictionary with the last occurrence of each alphabet
-        letter inside the pattern.
+        return shift
 
-        Note: This function uses str.rfind, which already is a pattern
-        matching algorithm. There are more 'basic' ways to generate this
-        dictionary."""
-        self.occurrences = dict()
-        for letter in alphabet:
-            self.occurrences[letter] = pattern.rfind(letter)
+    def _search(self, text):
+        """Yield the starting index of every occurrence of the pattern in text."""
+        pattern = self.pattern
+        bad_character = self.bad_character
+        good_suffix = self.good_suffix
+        m = len(pattern)
+        n = len(text)
 
-    def __call__(self, letter):
-        """Return last position of the specified letter inside the pattern.
-        Return -1 if letter not found in pattern."""
-        return self.occurrences[letter]
+        if m == 0:
+            yield 0
+            return
+
+        s = 0  # alignment of the pattern in the text
+        while s <= n - m:
+            j = m - 1  # pattern index
+            while j >= 0 and pattern[j] == text[s + j]:
+                j -= 1
+            if j < 0:
+                yield s
+                s += good_suffix[0]
+            else:
+                s += max(good_suffix[j + 1], j - bad_character.get(text[s + j], -1))
+
+    def search_first(self, text):
+        """
+        Find the first occurrence of the pattern in text.
+
+        Args:
+            text (str): A string of text.
+
+        Returns:
+            Starting index of the pattern if pattern is found, else -1.
+        """
+        return next(self._search(text), -1)
+
+    def search_all(self, text):
+        """
+        Find all occurrences of the pattern in text, including overlapping ones.
+
+        Args:
+            text (str): A string of text.
+
+        Returns:
+            A list of the starting indexes of the pattern, in ascending order.
+        """
+        return list(self._search(text))
+
+
+class AhoCorasick(object):
+    """
+    Aho-Corasick automaton for matching several patterns in a single pass over a text.
+
+    The precomputation time complexity is O(M), where M is the total length of the patterns. The time complexity for
+    the searching phase is O(n + z), where z is the number of occurrences found.
+    """
+
+    def __init__(self, patterns):
+        """
+        Builds the automaton.
+
+        Args:
+            patterns (list): A list of non-empty patterns to find.
+        """
+        self.patterns = list(patterns)
+        self.goto = [{}]  # goto[state][letter] is the next state in the trie
+        self.fail = [0]  # fail[state] is the state of the longest proper suffix that is also in the trie
+        self.output = [[]]  # output[state] is the list of pattern numbers that end at this state
+
+        # Build the trie of patterns
+        for pattern_number, pattern in enumerate(self.patterns):
+            state = 0
+            for letter in pattern:
+                next_state = self.goto[state].get(letter)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][letter] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(pattern_number)
+
+        # Compute the failure links breadth-first, so that shorter suffixes are done first
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for letter, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and letter not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(letter, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def _search(self, text):
+        """Yield (end index, pattern number) for every occurrence of a pattern in text."""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for i, letter in enumerate(text):
+            while state and letter not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(letter, 0)
+            for pattern_number in output[state]:
+                yield i, pattern_number
+
+    def search_all(self, text):
+        """
+        Find all occurrences of every pattern in text.
+
+        Args:
+            text (str): A string of text.
+
+        Returns:
+            A list of (starting index, pattern) tuples, ordered by the end of each occurrence.
+        """
+        return [(i - len(self.patterns[number]) + 1, self.patterns[number]) for i, number in self._search(text)]
+
+    def matched_patterns(self, text):
+        """
+        Find which patterns occur in text. Stops early once every pattern has been found.
+
+        Args:
+            text (str): A string of text.
+
+        Returns:
+            A list of the patterns that occur in <text>, in the order they were given.
+        """
+        found = set()
+        for _, pattern_number in self._search(text):
+            found.add(pattern_number)
+            if len(found) == len(self.patterns):
+                break
+        return [self.patterns[number] for number in sorted(found)]
 
 
 def boyer_moore_match(text, pattern):
@@ -39,24 +221,7 @@ def boyer_moore_match(text, pattern):
     Returns: 
         Starting index of the pattern if pattern is found, else -1.
     """
-    alphabet = set(text)
-    last = last_occurrence(pattern, alphabet)
-    m = len(pattern)
-    n = len(text)
-    i = m - 1  # text index
-    j = m - 1  # pattern index
-    while i < n:
-        if text[i] == pattern[j]:
-            if j == 0:
-                return i
-            else:
-                i -= 1
-                j -= 1
-        else:
-            l = last(text[i])
-            i = i + m - min(j, 1+l)
-            j = m - 1
-    return -1
+    return BoyerMoorePattern(pattern).search_first(text)
 
 
 def naive_match(text, pattern):
@@ -92,13 +257,55 @@ def naive_match(text, pattern):
     return -1
 
 
+def naive_search_all(text, pattern):
+    """Find all occurrences of a non-empty pattern in text, including overlapping ones, by checking every index."""
+    return [i for i in range(len(text) - len(pattern) + 1) if text[i:i + len(pattern)] == pattern]
+
+
 def tests():
     try:
         assert boyer_moore_match("abcd", "cd") == 2
         assert boyer_moore_match("abcd", "lol") == -1
         assert boyer_moore_match("ICT1002", "ICT") == 0
-    except AssertionError:
-        print("Something went wrong...")
+
+        # Periodic patterns and overlapping matches, which rely on the good suffix shift
+        assert BoyerMoorePattern("abab").search_all("abababab") == [0, 2, 4]
+        assert BoyerMoorePattern("aaa").search_all("aaaaa") == [0, 1, 2]
+        assert BoyerMoorePattern("abcab").search_all("abcabcabcab") == [0, 3, 6]
+        # A pattern longer than the text, and an empty pattern
+        assert BoyerMoorePattern("abcdef").search_all("abc") == []
+        assert BoyerMoorePattern("abcdef").search_first("abc") == -1
+        assert BoyerMoorePattern("").search_first("abc") == 0
+        assert boyer_moore_match("", "") == 0
+
+        texts = ["abababab", "aaaaa", "abcabcabcab", "anpanman", "xyzabcxyzabxyz", "ICT1002 ICT1002", "baabaabaab"]
+        patterns = ["abab", "aa", "a", "abc", "bab", "anman", "xyz", "abx", "ICT1002", "aabaab", "baab", "zz"]
+        for text in texts:
+            for pattern in patterns:
+                compiled = BoyerMoorePattern(pattern)
+                assert compiled.search_all(text) == naive_search_all(text, pattern), (text, pattern)
+                assert compiled.search_first(text) == naive_match(text, pattern), (text, pattern)
+
+        # Aho-Corasick: overlapping terms, a term that is a prefix of another, and a term that is a suffix of another
+        automaton = AhoCorasick(["he", "she", "hers"])
+        assert sorted(automaton.search_all("ushers")) == [(1, "she"), (2, "he"), (2, "hers")]
+        assert automaton.matched_patterns("ushers") == ["he", "she", "hers"]
+        assert automaton.matched_patterns("hershey") == ["he", "she", "hers"]
+        assert automaton.matched_patterns("shell") == ["he", "she"]
+        assert automaton.matched_patterns("xyz") == []
+
+        term_lists = [["he", "she", "hers"], ["ab", "abc", "abcd"], ["bc", "abc", "c"], ["a", "aa", "aaa"],
+                      ["money", "free money", "ney"], ["ICT", "1002", "T10"]]
+        texts += ["ushers", "hershey", "xabcdx", "free money now", "ICT1002", ""]
+        for terms in term_lists:
+            automaton = AhoCorasick(terms)
+            for text in texts:
+                assert automaton.matched_patterns(text) == [term for term in terms if term in text], (terms, text)
+                expected = sorted((i, term) for term in terms for i in naive_search_all(text, term))
+                assert sorted(automaton.search_all(text)) == expected, (terms, text)
+    except AssertionError as e:
+        print("Something went wrong...", e)
+        return
 
     print('Test Cases Passed.')
 
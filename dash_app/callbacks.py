@@ -7,115 +7,471 @@ Defines callback functions for the Dash app. This is how the application is able
 
 import base64
 import datetime
-import io
+import hashlib
 import json
+from collections import Counter
 
 from app import app
-from data import parse_data, DATASET, export_data
-from bm_alg import boyer_moore_match
-from routes import save_file, download, file_download_link
-from dash.dependencies import Input, Output, State
-
-try:
-    from predict_input import predict, MODEL
-except ModuleNotFoundError:
-    print('[WARNING] tensorflow not found.')
+from data import DATASET_COLUMNS, load_default_data, sort_data
+from datasets import store_dataset, get_dataset
+from bm_alg import BoyerMoorePattern, AhoCorasick
+from cache import LRUCache
+from routes import download, file_download_link, EXPORTS
+from exports import get_artifact, start_garbage_collector
+from stats import date_slider_properties
+from uploads import latest_upload
+from ingest import parse_uploads
+from dataset_cache import file_digest, upload_digest, load_cached, store_cached
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
+from flask import send_file
+from inference_client import InferenceClient
 
 import dash
 import plotly.express as px
+import numpy as np
 import pandas as pd
 import dash_html_components as html
 
+# The model is loaded by the inference server (see runserver.py), not by the app
+INFERENCE = InferenceClient()
+
 # Initialize data for initial layout
-df, DATA, CATEGORIES, COLUMNS = parse_data(DATASET)
+DEFAULT_DATASET = load_default_data()
+COLUMNS = DEFAULT_DATASET.columns
+
+# Separates the terms of a multi-term query, e.g. "viagra|lottery|wire transfer"
+TERM_SEPARATOR = '|'
+# Extra column listing the terms that matched each row of a multi-term query
+MATCHES_COLUMN = {"name": "Matches", "id": "Matches"}
+
+# Categories of the dropdown, which datasets keep the positions of
+CATEGORIES = ('all', 'spam', 'ham')
+# Columns the table can be sorted by
+SORT_COLUMNS = DATASET_COLUMNS + [MATCHES_COLUMN['id']]
+
+# Search results shared by search_data and get_graph, bounded by the total number of cached rows
+SEARCH_CACHE_MAX_ENTRIES = 256
+SEARCH_CACHE_MAX_ROWS = 20000000
+SEARCH_CACHE = LRUCache(max_entries=SEARCH_CACHE_MAX_ENTRIES, max_size=SEARCH_CACHE_MAX_ROWS,
+                        sizeof=lambda result: len(result[0]))
+
+# Sort orders of search results, so that paging through them does not sort them again
+SORT_CACHE_MAX_ENTRIES = 64
+SORT_CACHE = LRUCache(max_entries=SORT_CACHE_MAX_ENTRIES, max_size=SEARCH_CACHE_MAX_ROWS, sizeof=len)
+
+# Latest search key of each session, so that searches superseded by a newer query can be abandoned
+LATEST_SEARCHES = LRUCache(max_entries=10000, sizeof=lambda key: 0)
+# Number of rows to search between checks for a superseding query
+CANCEL_CHECK_INTERVAL = 1000
+# Number of rows converted to CSV at a time when exporting search results
+EXPORT_CHUNK_ROWS = 10000
 
 
-def parse_json(json_data, category):
+ERROR_MSG = ("There was a problem processing your files. Please ensure the correct format is used." +
+             " Only CSV files with the headings: ['Datetime', 'Spam', 'Label', 'Relevance', 'Text']" +
+             " are supported at the moment.")
+EXPIRED_MSG = "Your uploaded dataset has expired. Please upload it again."
+INVALID_MSG = "The dataset could not be found."
+
+
+class SearchCancelled(Exception):
+    """Raised when a search is abandoned because a newer query has superseded it."""
+
+
+def parse_json(json_data, session_id=None):
     """
-    Parses the <json_data> from intermediate value.
+    Parses the <json_data> from intermediate value, and retrieves the dataset it refers to.
 
     Args:
-        json_data (str): A string of data to process in JSON format.
-        category (str): The category ('all' / 'spam' / 'ham') to extract data from.
+        json_data (str): A handle to the uploaded dataset in JSON format, or None for the default dataset.
+        session_id (str): The ID of the user's session, which the dataset was uploaded in.
 
     Returns:
-        (status_code, data), where status_code = 0 if there is no error, 1 otherwise.
+        (status_code, dataset), where status_code = 0 if there is no error, 1 otherwise.
+        dataset is the Dataset, or the error message.
     """
     if json_data:
-        loaded_data = json.loads(json_data)
-        categories = loaded_data['categories']
-        error = loaded_data['error']
+        # The handle may come from the query parameters of an export link
+        try:
+            loaded_data = json.loads(json_data)
+            error, handle = loaded_data['error'], loaded_data['dataset']
+        except (ValueError, TypeError, KeyError):
+            return (1, INVALID_MSG)
 
         if error:
             return (1, error)
 
-        data = categories[category]
+        dataset = get_dataset(session_id, handle)
+        if dataset is None:
+            return (1, EXPIRED_MSG)
+
+        return (0, dataset)
 
     else:
-        data = CATEGORIES[category]
+        return (0, DEFAULT_DATASET)
+
+
+def parse_query(query):
+    """
+    Splits a user query into its search terms. Terms are separated by TERM_SEPARATOR.
+
+    Args:
+        query (str): A user query.
+
+    Returns:
+        A list of distinct, non-empty search terms.
+    """
+    if not query:
+        return []
+
+    # A single term is searched for exactly as typed
+    if TERM_SEPARATOR not in query:
+        return [query]
+
+    terms = []
+    for term in query.split(TERM_SEPARATOR):
+        term = term.strip()
+        if term and term not in terms:
+            terms.append(term)
+    return terms
 
-    return (0, data)
+
+def check_cancelled(positions, cancelled):
+    """
+    Iterates over <positions>, checking every CANCEL_CHECK_INTERVAL rows whether the search has been cancelled.
+
+    Args:
+        positions (array): The positions of the rows to search.
+        cancelled (function): Returns True if the search has been cancelled, or None if it cannot be cancelled.
+
+    Raises:
+        SearchCancelled: If <cancelled> returns True.
+    """
+    positions = positions.tolist()
+    if cancelled is None:
+        yield from positions
+        return
+
+    for count, position in enumerate(positions):
+        if count % CANCEL_CHECK_INTERVAL == 0 and cancelled():
+            raise SearchCancelled
+        yield position
 
 
-def get_data(query, data):
+def get_data(query, dataset, category, previous=None, cancelled=None):
     """
-    Queries <data> for the specified <query>.
+    Queries the <category> of <dataset> for the specified <query>.
+    If <query> has multiple terms, a row matches if any of the terms is found, and the terms found in each row are
+    returned too.
 
     Args:
         query (str): A user query.
-        data (list): A list of data to query.
+        dataset (Dataset): The dataset to query.
+        category (str): The category ('all' / 'spam' / 'ham') to query.
+        previous (tuple): The result of a previous single-term query whose term is contained in the term of <query>.
+            Only those rows can match <query>, so they are refined instead of searching the whole category.
+        cancelled (function): Returns True if the search should be abandoned.
 
     Returns:
-        A list of data that satisfies the <query>.
-    """
-    # Use B-M algorithm to find relevant matches
-    if query:
-        result = []
-        for row in data:
-            text = row['Text']
-            match = boyer_moore_match(text, query)
-            if match != -1:
-                result.append(row)
-        return result
+        (positions, matches), where positions is the array of positions of the rows that satisfy the <query>, and
+        matches is the list of terms found in each row (joined by TERM_SEPARATOR), or None for a single-term query.
+
+    Raises:
+        SearchCancelled: If <cancelled> returns True during the search.
+    """
+    positions = dataset.positions[category]
+    terms = parse_query(query)
 
     # No query in the beginning
-    else:
-        return data
+    if not terms:
+        return positions, None
+
+    candidates = set()
+    for term in terms:
+        term_candidates = dataset.index.candidates(term)
+        if term_candidates is None:
+            # The term is too short to narrow down the rows
+            candidates = None
+            break
+        candidates.update(term_candidates)
+
+    if candidates is not None:
+        # Only the candidate rows can contain the query
+        candidates = np.fromiter(sorted(candidates), dtype=positions.dtype, count=len(candidates))
+        candidates = np.intersect1d(positions, candidates, assume_unique=True)
+
+    if previous is not None and (candidates is None or len(previous[0]) < len(candidates)):
+        # The query extends the previous query, so only the previous matches need to be checked again
+        positions = previous[0]
+    elif candidates is not None:
+        positions = candidates
+
+    texts = dataset.texts
+    if len(terms) == 1:
+        # Use B-M algorithm to find relevant matches, compiling the pattern once for the whole corpus
+        pattern = BoyerMoorePattern(terms[0])
+        result = [position for position in check_cancelled(positions, cancelled)
+                  if pattern.search_first(texts[position]) != -1]
+        return np.array(result, dtype=positions.dtype), None
+
+    # Use Aho-Corasick algorithm to find all the terms in a single pass over each row
+    automaton = AhoCorasick(terms)
+    result = []
+    matches = []
+    for position in check_cancelled(positions, cancelled):
+        matched = automaton.matched_patterns(texts[position])
+        if matched:
+            result.append(position)
+            matches.append(TERM_SEPARATOR.join(matched))
+    return np.array(result, dtype=positions.dtype), matches
+
+
+def dataset_fingerprint(json_data):
+    """
+    Identifies the dataset in <json_data>, for use in cache keys.
+
+    Args:
+        json_data (str): A handle to the uploaded dataset in JSON format, or None for the default dataset.
+
+    Returns:
+        A string that is the same for identical datasets.
+    """
+    if not json_data:
+        return 'default'
+    return hashlib.sha1(json_data.encode('utf-8')).hexdigest()
+
+
+def previous_result(key):
+    """
+    Finds a cached result that the search for <key> can refine, i.e. the result of a single-term query on the same
+    dataset and category, whose term is contained in the term of the query in <key> (e.g. "lotter" --> "lottery").
+
+    Args:
+        key (tuple): A search key, (dataset fingerprint, category, query).
+
+    Returns:
+        The cached result for the longest such query, or None if there is none.
+    """
+    fingerprint, category, query = key
+    terms = parse_query(query)
+    if len(terms) != 1:
+        return None
+
+    best_term, best_result = '', None
+    for previous_key in SEARCH_CACHE.keys():
+        previous_fingerprint, previous_category, previous_query = previous_key
+        if (previous_fingerprint, previous_category) != (fingerprint, category) or previous_query == query:
+            continue
+
+        previous_terms = parse_query(previous_query)
+        if len(previous_terms) == 1 and len(previous_terms[0]) > len(best_term) and previous_terms[0] in terms[0]:
+            result = SEARCH_CACHE.peek(previous_key)
+            if result is not None:
+                best_term, best_result = previous_terms[0], result
+
+    return best_result
+
+
+def search(query, category, json_data, session_id=None, cancellable=True):
+    """
+    Queries the <category> of the dataset in <json_data> for the specified <query>.
+    Results are cached in SEARCH_CACHE, so repeated and concurrent searches are answered from memory, and a query
+    that extends a cached query only refines the cached result.
+
+    Args:
+        query (str): A user query.
+        category (str): The category ('all' / 'spam' / 'ham') to extract data from.
+        json_data (str): A handle to the uploaded dataset in JSON format.
+        session_id (str): The ID of the user's session. A newer search in the same session abandons this one.
+        cancellable (bool): Whether a newer search in the same session abandons this one.
+
+    Returns:
+        (status_code, dataset, result), where status_code = 0 if there is no error, 1 otherwise.
+        dataset is the Dataset that was queried, or the error message, and result is returned by get_data.
+
+    Raises:
+        PreventUpdate: If the search was superseded by a newer search in the same session.
+    """
+    status_code, dataset = parse_json(json_data, session_id)
+    if status_code == 1:
+        return status_code, dataset, None
+
+    key = (dataset_fingerprint(json_data), category, query or '')
+
+    cancelled = None
+    if session_id is not None and cancellable:
+        LATEST_SEARCHES.put(session_id, key)
+        cancelled = lambda: LATEST_SEARCHES.peek(session_id) != key
+
+    def compute():
+        return get_data(query, dataset, category, previous_result(key), cancelled)
+
+    try:
+        return status_code, dataset, SEARCH_CACHE.get_or_compute(key, compute)
+    except SearchCancelled:
+        # Leave the outputs as they are, the newer search will update them
+        raise PreventUpdate
+
+
+def sorted_search(query, category, json_data, session_id, sort_by, cancellable=True):
+    """
+    Queries the <category> of the dataset in <json_data> for the specified <query>, and sorts the result.
+    Sort orders are cached in SORT_CACHE.
+
+    Args:
+        query (str): A user query.
+        category (str): The category ('all' / 'spam' / 'ham') to extract data from.
+        json_data (str): A handle to the uploaded dataset in JSON format.
+        session_id (str): The ID of the user's session.
+        sort_by (list): The sort_by property of the table, [{'column_id': column_id, 'direction': 'asc' / 'desc'}].
+        cancellable (bool): Whether a newer search in the same session abandons this one.
+
+    Returns:
+        (status_code, dataset, result), as returned by search.
+    """
+    status_code, dataset, result = search(query, category, json_data, session_id, cancellable)
+    if status_code == 1 or not sort_by:
+        return status_code, dataset, result
+
+    positions, matches = result
+    column_id = sort_by[0]['column_id']
+    descending = sort_by[0]['direction'] == 'desc'
+    if column_id not in dataset.ranks and matches is None:
+        # e.g. sorting by the 'Matches' column of a previous multi-term query
+        return status_code, dataset, result
+
+    key = (dataset_fingerprint(json_data), category, query or '', column_id, descending)
+    order = SORT_CACHE.get_or_compute(
+        key, lambda: sort_data(positions, column_id, descending, dataset.ranks, matches))
+
+    return status_code, dataset, (positions[order], None if matches is None else [matches[i] for i in order])
+
+
+def matched_count(query, result):
+    """
+    Describes the number of items matched by <query>, and for multi-term queries, the number of items matched by
+    each term.
+
+    Args:
+        query (str): A user query.
+        result (tuple): The result returned by get_data for <query>.
+
+    Returns:
+        A string in the format "<length of data> items matched".
+    """
+    positions, matches = result
+    if matches is None:
+        return "{} items matched.".format(len(positions))
+
+    hits = Counter(term for matched in matches for term in matched.split(TERM_SEPARATOR))
+    terms = parse_query(query)
+    return "{} items matched ({}).".format(len(positions), ', '.join('{}: {}'.format(term, hits[term]) for term in terms))
 
 
 @app.callback(
-    [Output("table-index", "data"), Output('matched-count-index', 'children'), Output('export-data', 'children')],
+    [Output("table-index", "data"), Output("table-index", "columns"), Output("table-index", "page_count"),
+     Output("table-index", "page_current"), Output('matched-count-index', 'children'),
+     Output('export-data', 'children')],
     [Input("search", "value"), Input("dropdown", "value"),
-     Input("intermediate-value", "children")]
+     Input("intermediate-value", "children"), Input("table-index", "page_current"),
+     Input("table-index", "page_size"), Input("table-index", "sort_by")],
+    [State("session-id", "data")]
 )
-def search_data(query, category, intermediate_value):
+def search_data(query, category, intermediate_value, page_current, page_size, sort_by, session_id):
     """
     Searches <intermediate_value> based on user-specified <query> and <category>.
+    The matching data is kept on the server, and only the requested page of it is sent to the table.
 
     Args:
         query (str): A search query.
         category (str): A category ('all' / 'spam' / 'ham').
-        intermediate_value (str): A string of data to process in JSON format.
+        intermediate_value (str): A handle to the uploaded dataset in JSON format.
+        page_current (int): The current page of the table.
+        page_size (int): The number of rows in a page of the table.
+        sort_by (list): The columns to sort the table by.
+        session_id (str): The ID of the user's session.
 
     Returns:
-        A list of matching data, and a string in the format "<length of data> items matched".
+        The requested page of matching data, the table columns (with a 'Matches' column for multi-term queries), the
+        number of pages, the page displayed, and a string in the format "<length of data> items matched".
     """
-    status_code, data = parse_json(intermediate_value, category)
+    # A new query, category, sort order or dataset starts again from the first page
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    if any(prop_id.split('.')[0] in ('search', 'dropdown', 'intermediate-value') or prop_id == 'table-index.sort_by'
+           for prop_id in triggered):
+        page_current = 0
+
+    status_code, dataset, result = sorted_search(query, category, intermediate_value, session_id, sort_by)
 
-    download_link = file_download_link('output.csv')
+    # The export is generated from the cached results when the link is clicked
+    download_link = file_download_link('output.csv', query=query, category=category, dataset=intermediate_value,
+                                       session=session_id, sort_by=json.dumps(sort_by or []))
     anchor = html.A(html.Button('Export Results', id='exportBtn', n_clicks=0),
-        href=download_link, download=download_link)
+        href=download_link, download='output.csv')
 
     if status_code == 1:
         # Display empty table, and show the error message
-        return [], data, anchor
+        return [], COLUMNS, 1, 0, dataset, anchor
+
+    positions, matches = result
+    columns = dataset.columns + [MATCHES_COLUMN] if matches is not None else dataset.columns
+
+    # Stay on the last page if the new result has fewer pages
+    page_count = max(-(-len(positions) // page_size), 1)
+    page_current = min(page_current or 0, page_count - 1)
+    page = slice(page_current * page_size, (page_current + 1) * page_size)
+    data = dataset.rows(positions[page], None if matches is None else matches[page])
+
+    return data, columns, page_count, page_current, matched_count(query, result), anchor
+
+
+def make_graphs(dataset, result, date_range):
+    """
+    Generates the bar graph, pie chart and line graph of the stats page.
+
+    Args:
+        dataset (Dataset): The dataset that was queried.
+        result (tuple): The result returned by get_data.
+        date_range (list): A date range, [start_date, end_date], in days since 1970-01-01.
+
+    Returns:
+        A bar graph, pie chart and line graph, as Plotly graph objects.
+    """
+    # The slider values are days since 1970-01-01, and the end date is inclusive
+    start_date = np.datetime64(date_range[0], 'D')
+    end_date = np.datetime64(date_range[1] + 1, 'D')
 
-    data = get_data(query, data)
+    # Count the matched rows in the date range by label and by date in a single vectorized pass
+    positions, _ = result
+    positions = dataset.in_date_range(positions, start_date, end_date)
+    label_counts, date_counts = dataset.count_by_label_and_date(positions)
 
-    output = export_data(data_dict=data)
-    save_file('output.csv', output)
+    labels = np.flatnonzero((label_counts > 0) & (dataset.top_labels != 'Uncategorized'))
+    top_labels = labels[np.argsort(-label_counts[labels], kind='stable')][:10]
+    dates = np.flatnonzero(date_counts)
 
-    return data, "{} items matched.".format(len(data)), anchor
+    categories_result = {
+        'Label': dataset.top_labels[top_labels].tolist(),
+        'Count': label_counts[top_labels].tolist()
+    }
+    date_result = {
+        'Dates': dataset.dates[dates].tolist(),
+        'Count': date_counts[dates].tolist()
+    }
+
+    bar_graph = px.bar(pd.DataFrame(categories_result), x='Label', y='Count',
+                       hover_data=['Label', 'Count'], color='Count',
+                       labels={'Label': 'Email Content Categories'}, height=400)
+
+    pie = px.pie(pd.DataFrame(categories_result), values='Count', names='Label',
+                 labels={'Label': "Email Content Categories", 'Count': "Number Of Emails"})
+
+    line_graph = px.line(pd.DataFrame(date_result), x="Dates", y="Count",
+                         title="Number of Emails sent on Each Day")
+    line_graph.update_layout(xaxis={'type': 'category'})
+
+    return bar_graph, pie, line_graph
 
 
 @app.callback(
@@ -125,9 +481,10 @@ def search_data(query, category, intermediate_value):
      Output('matched-count-stats', 'children'),
      Output('export-charts', 'children')],
     [Input("search", "value"), Input("dropdown", "value"),
-     Input("intermediate-value", "children"), Input("date-slider", "value")]
+     Input("intermediate-value", "children"), Input("date-slider", "value")],
+    [State("session-id", "data")]
 )
-def get_graph(query, category, intermediate_value, date_range):
+def get_graph(query, category, intermediate_value, date_range, session_id):
     """
     Generates the following visualizations
     - bar graph of email categories
@@ -138,17 +495,21 @@ def get_graph(query, category, intermediate_value, date_range):
     Args:
         query (str): A search query.
         category (str): A category ('all' / 'spam' / 'ham').
-        intermediate_value (str): A string of data to process in JSON format.
-        date_range (list): A date range, [start_date, end_date].
+        intermediate_value (str): A handle to the uploaded dataset in JSON format.
+        date_range (list): A date range, [start_date, end_date], in days since 1970-01-01.
+        session_id (str): The ID of the user's session.
 
     Returns:
         A bar graph, pie chart, line graph, and a string in the format "<length of data> items matched".
     """
-    status_code, data = parse_json(intermediate_value, category)
+    status_code, dataset, result = search(query, category, intermediate_value, session_id)
 
-    download_link = file_download_link('stats_output.html')
+    # The export is generated from the cached results when the link is clicked
+    download_link = file_download_link('stats_output.html', query=query, category=category,
+                                       dataset=intermediate_value, session=session_id,
+                                       start=date_range[0], end=date_range[1])
     anchor = html.A(html.Button('Export Results', id='exportBtn', n_clicks=0),
-        href=download_link, download=download_link)
+        href=download_link, download='stats_output.html')
 
     if status_code == 1:
         # Display empty figure, and show the error message
@@ -173,126 +534,325 @@ def get_graph(query, category, intermediate_value, date_range):
                 ]
             }
         }
-        return empty_fig, empty_fig, empty_fig, data, anchor
+        return empty_fig, empty_fig, empty_fig, dataset, anchor
 
-    data = get_data(query, data)
-    categories_result = {}
-    date_result = {}
-    start_date, end_date = date_range[0], date_range[1]
+    bar_graph, pie, line_graph = make_graphs(dataset, result, date_range)
 
-    for row in data:
-        date = row["Datetime"].split()[0]
+    return bar_graph, pie, line_graph, matched_count(query, result), anchor
 
-        if int(date[-1]) in range(start_date, end_date+1):
-            label = row['Label'].split('>')[0]
 
-            if not label == 'Uncategorized':
-                categories_result.setdefault(label, 0)
-                categories_result[label] += 1
+def send_artifact(path, filename, mimetype):
+    """
+    Sends a stored export to the user as an attachment.
 
-            date_result.setdefault(date, 0)
-            date_result[date] += 1
+    Args:
+        path (str): The path of the stored file.
+        filename (str): The file name to save the file as.
+        mimetype (str): The MIME type of the file.
 
-    categories_sorted_data = sorted(list(categories_result.items()),
-                                    key=lambda x: x[1], reverse=True)[:10]
-    date_sorted_data = sorted(list(date_result.items()),
-                              key=lambda x: x[0])
+    Returns:
+        A Flask response.
+    """
+    response = send_file(path, mimetype=mimetype, as_attachment=True)
+    response.headers['Content-Disposition'] = 'attachment; filename={}'.format(filename)
+    return response
 
-    categories_result = {
-        'Label': [item[0] for item in categories_sorted_data],
-        'Count': [item[1] for item in categories_sorted_data]
-    }
-    date_result = {
-        'Dates': [item[0] for item in date_sorted_data],
-        'Count': [item[1] for item in date_sorted_data]
-    }
 
-    bar_graph = px.bar(pd.DataFrame(categories_result), x='Label', y='Count',
-                       hover_data=['Label', 'Count'], color='Count',
-                       labels={'Label': 'Email Content Categories'}, height=400)
+def parse_export_args(args):
+    """
+    Reads and validates the query parameters shared by the export links, which come from the browser.
 
-    pie = px.pie(pd.DataFrame(categories_result), values='Count', names='Label',
-                 labels={'Label': "Email Content Categories", 'Count': "Number Of Emails"})
+    Args:
+        args (dict): The query parameters of a download link.
 
-    line_graph = px.line(pd.DataFrame(date_result), x="Dates", y="Count",
-                         title="Number of Emails sent on Each Day")
-    line_graph.update_layout(xaxis={'type': 'category'})
+    Returns:
+        (json_data, category, query, session_id, sort_by).
+
+    Raises:
+        ValueError: If the category or the sort order is not valid.
+    """
+    category = args.get('category', 'all')
+    if category not in CATEGORIES:
+        raise ValueError("The category must be one of {}.".format(', '.join(CATEGORIES)))
 
-    output = (
-        bar_graph.to_html(full_html=False, include_plotlyjs='cdn') +
-        pie.to_html(full_html=False, include_plotlyjs='cdn') +
-        line_graph.to_html(full_html=False, include_plotlyjs='cdn')
-    )
-    save_file('stats_output.html', output)
+    try:
+        sort_by = json.loads(args.get('sort_by', '[]'))
+    except ValueError:
+        sort_by = None
+    if not isinstance(sort_by, list) or not all(
+            isinstance(column, dict) and column.get('column_id') in SORT_COLUMNS and
+            column.get('direction') in ('asc', 'desc') for column in sort_by):
+        raise ValueError("The sort order must be a JSON list of {'column_id': one of " + ', '.join(SORT_COLUMNS) +
+                         ", 'direction': 'asc' or 'desc'}.")
 
-    return bar_graph, pie, line_graph, "{} items matched.".format(len(data)), anchor
+    return args.get('dataset'), category, args.get('query'), args.get('session'), sort_by
 
 
-def parse_contents(contents, filename, date):
+def export_results(args):
     """
-    Parses user-submitted dataset.
+    Exports search results as a CSV file. The CSV file is generated from the cached results in chunks of
+    EXPORT_CHUNK_ROWS rows, and stored in the session's export directory, so the whole file is never held in memory.
 
     Args:
-        contents (str): A contents string generated from the user-uploaded file.
-        filename (str): The filename of the user-uploaded file.
-        date (str): The date of the user-uploaded file.
-    
+        args (dict): The query parameters of the download link created by search_data.
+
     Returns:
-        Processed data in the form of Python data structures.
+        A Flask response.
     """
-    content_type, content_string = contents.split(',')
-    decoded = base64.b64decode(content_string)
+    try:
+        json_data, category, query, session_id, sort_by = parse_export_args(args)
+    except ValueError as e:
+        return str(e), 400
 
-    if 'csv' in filename:
-        # Assume that the user uploaded a CSV file
-        df, data, categories, columns = parse_data(
-            io.StringIO(decoded.decode("ISO-8859-1")))
-    else:
-        raise ValueError("Only CSV format supported.")
+    status_code, dataset, result = sorted_search(query, category, json_data, session_id, sort_by, cancellable=False)
+    if status_code == 1:
+        return dataset, 404
+
+    positions, matches = result
+
+    def generate():
+        for start in range(0, max(len(positions), 1), EXPORT_CHUNK_ROWS):
+            chunk = slice(start, start + EXPORT_CHUNK_ROWS)
+            frame = dataset.frame(positions[chunk], None if matches is None else matches[chunk])
+            frame.index = range(start, start + len(frame))
+            yield frame.to_csv(None, header=start == 0)
+
+    key = ('output.csv', dataset_fingerprint(json_data), category, query or '', json.dumps(sort_by))
+    path = get_artifact(key, session_id, generate, '.csv')
+    return send_artifact(path, 'output.csv', 'text/csv')
+
+
+def export_charts(args):
+    """
+    Exports the graphs of the stats page as an HTML file, generated when it is downloaded and stored in the session's
+    export directory.
+
+    Args:
+        args (dict): The query parameters of the download link created by get_graph.
+
+    Returns:
+        A Flask response.
+    """
+    try:
+        json_data, category, query, session_id, _ = parse_export_args(args)
+    except ValueError as e:
+        return str(e), 400
 
-    return df, data, categories, columns
+    status_code, dataset, result = search(query, category, json_data, session_id, cancellable=False)
+    if status_code == 1:
+        return dataset, 404
+
+    # Without a date range, every date is exported, like the initial value of the date slider
+    first_day, last_day = date_slider_properties(dataset)['value']
+    try:
+        date_range = [int(args.get('start', first_day)), int(args.get('end', last_day))]
+    except ValueError:
+        return "The start and end of the date range must be whole numbers of days since 1970-01-01.", 400
+
+    def generate():
+        for figure in make_graphs(dataset, result, date_range):
+            yield figure.to_html(full_html=False, include_plotlyjs='cdn')
+
+    key = ('stats_output.html', dataset_fingerprint(json_data), category, query or '', tuple(date_range))
+    path = get_artifact(key, session_id, generate, '.html')
+    return send_artifact(path, 'stats_output.html', 'text/html')
+
+
+EXPORTS['output.csv'] = export_results
+EXPORTS['stats_output.html'] = export_charts
+start_garbage_collector()
+
+
+@app.callback(
+    [Output('date-slider', 'min'), Output('date-slider', 'max'), Output('date-slider', 'marks'),
+     Output('date-slider', 'value')],
+    [Input('intermediate-value', 'children')],
+    [State('session-id', 'data')]
+)
+def update_date_slider(intermediate_value, session_id):
+    """
+    Sets the bounds and marks of the date slider to the dates in the dataset, and selects every date.
+
+    Args:
+        intermediate_value (str): A handle to the uploaded dataset in JSON format.
+        session_id (str): The ID of the user's session.
+
+    Returns:
+        The min, max, marks and value of the date slider.
+    """
+    status_code, dataset = parse_json(intermediate_value, session_id)
+    if status_code == 1:
+        raise PreventUpdate
+
+    properties = date_slider_properties(dataset)
+    return properties['min'], properties['max'], properties['marks'], properties['value']
 
 
 @app.callback(
     Output('intermediate-value', 'children'),
-    [Input('upload-data', 'contents')],
+    [Input('upload-data', 'contents'),
+    Input('upload-interval', 'disabled')],
     [State('upload-data', 'filename'),
-    State('upload-data', 'last_modified')])
-def update_output(list_of_contents, list_of_names, list_of_dates):
+    State('upload-data', 'last_modified'),
+    State('session-id', 'data'),
+    State('intermediate-value', 'children')])
+def update_output(list_of_contents, polling_disabled, list_of_names, list_of_dates, session_id, intermediate_value):
     """
-    Updates the hidden #intermediate-value element based on the user-uploaded data.
-    If user uploads multiple files, combines the data from each file, and returns the aggregated data.
+    Parses the user-uploaded data and stores it on the server, then updates the hidden #intermediate-value element
+    with a handle to the stored dataset.
+    If user uploads multiple files, parses them in parallel, and stores the data of every file that could be parsed.
+    Files that were uploaded before are loaded from the dataset cache instead of being parsed again.
+    Datasets uploaded to the /upload route are picked up when the #upload-interval stops polling their progress.
 
     Args:
         list_of_contents (list): A list of user-uploaded file contents.
+        polling_disabled (bool): Whether the #upload-interval is disabled, i.e. no upload to the /upload route is
+            running.
         list_of_names (list): A list of user-uploaded file names.
         list_of_dates (list): A list of user-uploaded file dates.
+        session_id (str): The ID of the user's session.
+        intermediate_value (str): The current value of the #intermediate-value element.
 
     Returns:
-        A string with data in JSON format.
+        A string in JSON format, {'dataset': handle, 'error': error message, 'files': reports, 'upload': upload_id},
+        where reports lists the number of rows, parsing time and error of each uploaded file, and upload_id is the
+        latest upload to the /upload route when the dataset was stored.
     """
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    upload = latest_upload(session_id)
+    upload_id = None if upload is None else upload.upload_id
+
+    if 'upload-interval.disabled' in triggered:
+        # Only switch to an uploaded dataset once, so that it does not replace a later upload through dcc.Upload
+        if not polling_disabled or upload is None or upload.handle is None:
+            raise PreventUpdate
+        if intermediate_value and json.loads(intermediate_value).get('upload') == upload_id:
+            raise PreventUpdate
+        return json.dumps({'dataset': upload.handle, 'error': None, 'upload': upload_id})
+
     if list_of_contents is not None:
-        try:
-            results = [
-                parse_contents(c, n, d) for c, n, d in
-                zip(list_of_contents, list_of_names, list_of_dates)]
+        # Identical files were parsed before if their hash is in the dataset cache
+        digest = upload_digest(file_digest([base64.b64decode(contents.split(',', 1)[-1])])
+                               for contents in list_of_contents)
+        cached = load_cached(digest)
+        if cached is not None:
+            dataset, reports = cached
+            for report, filename in zip(reports, list_of_names):
+                report.update(filename=filename, seconds=0.0, cached=True)
 
-        except Exception as e:
-            print(e)
-            error_msg = ("There was a problem processing your files. Please ensure the correct format is used." +
-                         " Only CSV files with the headings: ['Datetime', 'Spam', 'Label', 'Relevance', 'Text']" +
-                         " are supported at the moment.")
-            categories = None
+        else:
+            try:
+                dataset, reports = parse_uploads(list_of_contents, list_of_names, list_of_dates)
+                if dataset is not None:
+                    store_cached(digest, (dataset, reports))
+
+            except Exception as e:
+                print(e)
+                dataset, reports = None, []
+
+        if dataset is None:
+            error_msg = ERROR_MSG
+            handle = None
 
         else:
-            categories = results[0][2]
-            for result in results[1:]:
-                categories['all'] += result[2]['all']
-                categories['ham'] += result[2]['ham']
-                categories['spam'] += result[2]['spam']
+            handle = store_dataset(session_id, dataset, digest)
             error_msg = None
 
-        return json.dumps({'categories': categories, 'error': error_msg})
+        return json.dumps({'dataset': handle, 'error': error_msg, 'files': reports, 'upload': upload_id})
+
+
+@app.callback(
+    Output('upload-report', 'children'),
+    [Input('intermediate-value', 'children')])
+def update_upload_report(intermediate_value):
+    """
+    Displays the number of rows and the parsing time of each uploaded file, or why it could not be parsed.
+
+    Args:
+        intermediate_value (str): The value of the #intermediate-value element, set by update_output.
+
+    Returns:
+        A list of Dash HTML components, one line per file.
+    """
+    if not intermediate_value:
+        return []
+
+    lines = []
+    for report in json.loads(intermediate_value).get('files', []):
+        if report['error']:
+            line = '{}: not loaded ({})'.format(report['filename'], report['error'])
+        elif report.get('cached'):
+            line = '{}: {:,} rows (already parsed)'.format(report['filename'], report['rows'])
+        else:
+            line = '{}: {:,} rows in {:.2f} s'.format(report['filename'], report['rows'], report['seconds'])
+        lines.append(html.Div(line))
+    return lines
+
+
+app.clientside_callback(
+    ClientsideFunction(namespace='uploads', function_name='session'),
+    Output('upload-large-session', 'children'),
+    [Input('session-id', 'data')]
+)
+
+app.clientside_callback(
+    ClientsideFunction(namespace='uploads', function_name='upload_state'),
+    Output('upload-started', 'data'),
+    [Input('upload-large-notify', 'n_clicks')]
+)
+
+
+@app.callback(
+    [Output('upload-progress', 'children'), Output('upload-interval', 'disabled'), Output('upload-previous', 'data')],
+    [Input('upload-started', 'data'), Input('upload-interval', 'n_intervals')],
+    [State('upload-previous', 'data'), State('session-id', 'data')])
+def update_upload_progress(started, n_intervals, previous_upload_id, session_id):
+    """
+    Displays the progress of the session's latest upload to the /upload route.
+    Polling starts when a dataset is posted to the route from the #upload-large box (see assets/uploads.js), and stops
+    once the upload is done or has failed, or if the browser could not send it.
+
+    Args:
+        started (dict): The state of the latest upload in the browser, {'started': time in milliseconds, 'error':
+            why the file could not be sent, or None}.
+        n_intervals (int): Number of times the #upload-interval has fired.
+        previous_upload_id (str): The ID of the session's latest upload when the current upload was started.
+        session_id (str): The ID of the user's session.
+
+    Returns:
+        The progress message, whether to stop polling, and the ID of the upload before the current one.
+    """
+    triggered = [trigger['prop_id'] for trigger in dash.callback_context.triggered]
+    upload = latest_upload(session_id)
+
+    if 'upload-started.data' in triggered:
+        if started is None:
+            raise PreventUpdate
+        if started['error']:
+            return started['error'], True, previous_upload_id
+        # The upload is only saved by the route once its request arrives, so the previous upload is remembered until
+        # then
+        return 'Sending file...', False, None if upload is None else upload.upload_id
+
+    if 'upload-interval.n_intervals' not in triggered:
+        raise PreventUpdate
+
+    if upload is None or upload.upload_id == previous_upload_id:
+        return 'Sending file...', False, previous_upload_id
+
+    if upload.status == 'receiving':
+        message = 'Receiving file...'
+    elif upload.status == 'parsing':
+        message = 'Parsing file... {:,} rows'.format(upload.rows)
+    elif upload.status == 'done':
+        return 'Uploaded {:,} rows.'.format(upload.rows), True, previous_upload_id
+    else:
+        return upload.error, True, previous_upload_id
+
+    percent = upload.percent()
+    if percent is not None:
+        message += ' ({}%)'.format(percent)
+    return message, False, previous_upload_id
 
 
 @app.callback(
@@ -319,7 +879,7 @@ def toggle_language(n_clicks, target_lang):
             html.A('或选择自己的数据集')
         ])
         toggle_language_children = 'English'
-        search_placeholder = '搜索'
+        search_placeholder = '搜索（多个词用 | 分隔）'
         dropdown_options = [
             {'label': '所有邮件', 'value': 'all'},
             {'label': '垃圾邮件', 'value': 'spam'},
@@ -333,7 +893,7 @@ def toggle_language(n_clicks, target_lang):
             html.A('Select Your Own Datasets')
         ])
         toggle_language_children = '中文'
-        search_placeholder = 'Search'
+        search_placeholder = 'Search (separate multiple terms with |)'
         dropdown_options = [
             {'label': 'All', 'value': 'all'},
             {'label': 'Spam', 'value': 'spam'},
@@ -353,7 +913,7 @@ def predict_user_input(email, curr_data):
         try:
             result = curr_data
             email = [email]
-            prediction = predict(email, MODEL)[0]
+            prediction = INFERENCE.predict(email)[0]
             prediction = 'Spam' if prediction else 'Not Spam'
             result = [{'Spam': prediction, 'Text': email}] + result
             return result
@@ -2,70 +2,382 @@
 Extract data from the dataset/export data from the dataset using pandas.
 """
 
+import numpy as np
 import pandas as pd
 import os
+from functools import lru_cache
+from search_index import NgramIndex
+from snapshot import load_snapshot, save_snapshot
 
 DATASET = os.path.dirname(os.path.abspath(__file__)) + "/emails.csv"
+DATASET_COLUMNS = ['Datetime', 'Spam', 'Label', 'Relevance', 'Text']
+SPAM_CATEGORIES = ['Not Spam', 'Spam']
 
 
-def parse_data(dataset):
+def read_dataset(dataset):
     """
-    Parses the <dataset>.
+    Reads the <dataset> into a dataframe, without processing it.
 
     Args:
-        dataset (str): A file path to the dataset.
+        dataset (str): A file path to the dataset, or a file-like object.
 
     Returns:
-        df: A Pandas dataframe.
-        data: A list of parsed data.
-        categories: A dictionary of data, {'all': data, 'spam': data_spam, 'ham': data_ham}.
-        columns: A list of column headers.
+        A Pandas dataframe with the columns ['Datetime', 'Spam', 'Label', 'Relevance', 'Text'].
     """
     # Parse dataset into pandas dataframe
     df = pd.read_csv(dataset, encoding="ISO-8859-1",
                      converters={i: str for i in range(0, 100)})
     # reorganize columns
-    df = df[['Datetime', 'Spam', 'Label', 'Relevance', 'Text']]
+    return df[DATASET_COLUMNS]
+
+
+def read_dataset_chunks(dataset, chunksize):
+    """
+    Reads the <dataset> in chunks of rows, so that only one chunk of the file is parsed in memory at a time.
+
+    Args:
+        dataset (str): A file path to the dataset, or a file-like object.
+        chunksize (int): The number of rows in each chunk.
+
+    Returns:
+        A generator of Pandas dataframes with the columns ['Datetime', 'Spam', 'Label', 'Relevance', 'Text'].
+    """
+    reader = pd.read_csv(dataset, encoding="ISO-8859-1", chunksize=chunksize,
+                         converters={i: str for i in range(0, 100)})
+    try:
+        for chunk in reader:
+            yield chunk[DATASET_COLUMNS]
+    finally:
+        reader.close()
+
+
+class Dataset(object):
+    """
+    Columnar representation of a parsed dataset.
+
+    Each column is stored once, as an array (or a categorical, for columns with few distinct values). Rows are
+    identified by their position in the dataset, and categories and search results are arrays of positions. Rows are
+    only converted into dictionaries (with rows) or dataframes (with frame) when they are displayed or exported.
+    """
+
+    def __init__(self, df):
+        """
+        Args:
+            df: A Pandas dataframe returned by read_dataset.
+        """
+        spam = df['Spam'].to_numpy()
+        is_spam = spam == '1'
+
+        # Positions of the rows in each category
+        self.positions = {
+            'all': np.arange(len(df)),
+            'spam': np.flatnonzero(is_spam),
+            'ham': np.flatnonzero(spam == '0')
+        }
+
+        # Convert to verbose data, 1 --> Spam, 0 --> Not Spam
+        self.df = pd.DataFrame({
+            'Datetime': df['Datetime'].to_numpy(),
+            'Spam': pd.Categorical.from_codes(is_spam.astype(np.int8), categories=SPAM_CATEGORIES),
+            'Label': pd.Categorical(df['Label'].to_numpy()),
+            'Relevance': pd.Categorical(df['Relevance'].to_numpy()),
+            'Text': df['Text'].to_numpy()
+        })
+        self.columns = [{"name": i, "id": i} for i in self.df.columns]
+
+        # Build the search index once, so that queries do not have to scan every row
+        self.texts = self.df['Text'].tolist()
+        self.index = NgramIndex(self.texts)
+
+        # Parse the timestamps once, and sort them so that date ranges can be found by binary search
+        # Rows with a timestamp that cannot be parsed (NaT) are sorted last, and are never in a date range
+        timestamps = pd.to_datetime(self.df['Datetime'], errors='coerce').to_numpy()
+        self.time_order = np.argsort(timestamps, kind='stable')
+        self.sorted_times = timestamps[self.time_order]
+        self.time_rank = np.empty_like(self.time_order)
+        self.time_rank[self.time_order] = np.arange(len(self.time_order))
 
-    # convert dataframe into a list of dict
-    data = df.to_dict('records')
+        # The 'Datetime' column is sorted by time rather than by text
+        self.ranks = sort_ranks(self.df, [column_id for column_id in self.df.columns if column_id != 'Datetime'])
+        self.ranks['Datetime'] = self.time_rank
 
-    # list of dictionaries containing spam email
-    data_spam = [item for item in data if item['Spam'] == '1']
-    # list of dictionaries containing non-spam email
-    data_ham = [item for item in data if item['Spam'] == '0']
+        # Code of the date (without the time) and of the top-level label of each row, for counting rows with bincount
+        dates = pd.Series(timestamps).dt.strftime('%Y-%m-%d').fillna('')
+        self.date_codes, self.dates = factorize(dates)
+        label = self.df['Label']
+        top_label_codes, self.top_labels = factorize(label.cat.categories.str.split('>').str[0])
+        self.top_label_codes = top_label_codes[label.cat.codes.to_numpy()]
 
-    categories = {
-        'all': data,
-        'spam': data_spam,
-        'ham': data_ham
-    }
+    def to_snapshot(self):
+        """
+        Converts the dataset into arrays, to be saved with snapshot.save_snapshot.
 
-    # Convert to verbose data, 1 --> Spam, 0 --> Not Spam
-    for row in data:
-        row['Spam'] = 'Spam' if row['Spam'] == '1' else 'Not Spam'
-    columns = [{"name": i, "id": i} for i in df.columns]
+        Returns:
+            (arrays, strings, meta), see snapshot.save_snapshot.
+        """
+        grams, offsets, postings = self.index.to_arrays()
+        arrays = {
+            'positions.spam': self.positions['spam'],
+            'positions.ham': self.positions['ham'],
+            'time_order': self.time_order,
+            'sorted_times': self.sorted_times,
+            'time_rank': self.time_rank,
+            'date_codes': self.date_codes,
+            'top_label_codes': self.top_label_codes,
+            'index.offsets': offsets,
+            'index.postings': postings
+        }
+        strings = {
+            'Datetime': self.df['Datetime'].tolist(),
+            'Text': self.texts,
+            'dates': self.dates.tolist(),
+            'top_labels': self.top_labels.tolist()
+        }
+        for column_id in ['Spam', 'Label', 'Relevance']:
+            column = self.df[column_id]
+            arrays[column_id + '.codes'] = column.cat.codes.to_numpy()
+            strings[column_id + '.categories'] = column.cat.categories.tolist()
+        for column_id, rank in self.ranks.items():
+            if column_id != 'Datetime':
+                arrays['ranks.{}.rank'.format(column_id)] = rank
 
-    return df, data, categories, columns
+        meta = {'rows': len(self), 'grams': grams, 'ngram_size': self.index.n}
+        return arrays, strings, meta
 
+    @classmethod
+    def from_snapshot(cls, arrays, strings, meta):
+        """
+        Restores a dataset converted by to_snapshot, without parsing the dataset or building the search index again.
 
-def export_data(data_dict=None, dataframe=None, col=None):
+        Args:
+            arrays (dict): The arrays returned by snapshot.load_snapshot.
+            strings (dict): The lists of strings returned by snapshot.load_snapshot.
+            meta (dict): The other values returned by snapshot.load_snapshot.
 
-    # either dictionary or dataframe must be present
-    if data_dict is None and dataframe is None:
-        return
+        Returns:
+            A Dataset.
+        """
+        dataset = cls.__new__(cls)
+        dataset.positions = {
+            'all': np.arange(meta['rows']),
+            'spam': arrays['positions.spam'],
+            'ham': arrays['positions.ham']
+        }
 
-    # if choose to use dataframe, data_dict will not be in use
-    if dataframe:
-        dictionary = None
-        return dataframe.to_csv(None, encoding="ISO-8859-1")
+        columns = {
+            'Datetime': np.array(strings['Datetime'], dtype=object),
+            'Text': np.array(strings['Text'], dtype=object)
+        }
+        for column_id in ['Spam', 'Label', 'Relevance']:
+            columns[column_id] = pd.Categorical.from_codes(arrays[column_id + '.codes'],
+                                                           categories=strings[column_id + '.categories'])
+        dataset.df = pd.DataFrame(columns, columns=DATASET_COLUMNS)
+        dataset.columns = [{"name": i, "id": i} for i in dataset.df.columns]
 
-    # if choose to use custom dict, convert to dataframe before exporting
-    if data_dict:
-        # allows reorganization of columns
-        if col:
-            dataframe = pd.DataFrame(data_dict, columns=col)
+        dataset.texts = strings['Text']
+        dataset.index = NgramIndex.from_arrays(meta['grams'], arrays['index.offsets'], arrays['index.postings'],
+                                               meta['rows'], meta['ngram_size'])
+
+        dataset.time_order = arrays['time_order']
+        dataset.sorted_times = arrays['sorted_times']
+        dataset.time_rank = arrays['time_rank']
+        dataset.ranks = {column_id: arrays['ranks.{}.rank'.format(column_id)]
+                         for column_id in dataset.df.columns if column_id != 'Datetime'}
+        dataset.ranks['Datetime'] = dataset.time_rank
+
+        dataset.date_codes = arrays['date_codes']
+        dataset.dates = np.array(strings['dates'], dtype=object)
+        dataset.top_label_codes = arrays['top_label_codes']
+        dataset.top_labels = np.array(strings['top_labels'], dtype=object)
+        return dataset
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def nbytes(self):
+        """The approximate memory used by the dataset, in bytes."""
+        return int(self.df.memory_usage(deep=True).sum())
+
+    def date_bounds(self):
+        """
+        Returns:
+            (first_day, last_day), the dates (numpy.datetime64) of the earliest and latest rows, or (None, None) if
+            no row has a valid timestamp.
+        """
+        valid = self.sorted_times[~np.isnat(self.sorted_times)]
+        if not len(valid):
+            return None, None
+        return valid[0].astype('datetime64[D]'), valid[-1].astype('datetime64[D]')
+
+    def in_date_range(self, positions, start, end):
+        """
+        Selects the rows with a timestamp in a date range, using binary search over the sorted timestamps.
+
+        Args:
+            positions (array): The positions of the rows to select from.
+            start (numpy.datetime64): The start of the date range (inclusive).
+            end (numpy.datetime64): The end of the date range (exclusive).
+
+        Returns:
+            The array of positions of the selected rows, in the order of <positions>.
+        """
+        low, high = np.searchsorted(self.sorted_times, np.array([start, end], dtype=self.sorted_times.dtype))
+        rank = self.time_rank[positions]
+        return positions[(rank >= low) & (rank < high)]
+
+    def count_by_label_and_date(self, positions):
+        """
+        Counts rows by top-level label (e.g. 'Business' for 'Business>Finance') and by date.
+
+        Args:
+            positions (array): The positions of the rows to count.
+
+        Returns:
+            (label_counts, date_counts), the number of rows with each label in self.top_labels and on each date in
+            self.dates.
+        """
+        label_counts = np.bincount(self.top_label_codes[positions], minlength=len(self.top_labels))
+        date_counts = np.bincount(self.date_codes[positions], minlength=len(self.dates))
+        return label_counts, date_counts
+
+    def frame(self, positions, matches=None):
+        """
+        Selects rows of the dataset.
+
+        Args:
+            positions (array): The positions of the rows.
+            matches (list): The terms matched in each row by a multi-term query, added as the 'Matches' column.
+
+        Returns:
+            A Pandas dataframe of the rows, in the order of <positions>.
+        """
+        frame = self.df.iloc[positions].reset_index(drop=True)
+        if matches is not None:
+            frame['Matches'] = matches
+        return frame
+
+    def rows(self, positions, matches=None):
+        """
+        Converts rows of the dataset into dictionaries, e.g. to display them in a table.
+
+        Args:
+            positions (array): The positions of the rows.
+            matches (list): The terms matched in each row by a multi-term query, added as the 'Matches' field.
+
+        Returns:
+            A list of dictionaries, where the 'id' of each row is its position in the dataset.
+        """
+        rows = self.frame(positions, matches).to_dict('records')
+        for position, row in zip(np.asarray(positions).tolist(), rows):
+            row['id'] = position
+        return rows
+
+
+def factorize(values):
+    """
+    Encodes <values> as codes into their sorted distinct values.
+
+    Args:
+        values: A Pandas series or index.
+
+    Returns:
+        (codes, uniques), where codes is an array of integers, and uniques[codes[i]] == values[i].
+    """
+    codes, uniques = pd.factorize(values, sort=True)
+    return codes, np.asarray(uniques, dtype=object)
+
+
+def parse_data(dataset):
+    """
+    Parses the <dataset>.
+
+    Args:
+        dataset (str): A file path to the dataset, or a dataframe returned by read_dataset.
+
+    Returns:
+        A Dataset.
+    """
+    if isinstance(dataset, pd.DataFrame):
+        return Dataset(dataset)
+    return Dataset(read_dataset(dataset))
+
+
+def sort_ranks(df, columns):
+    """
+    Precomputes the rank of every row of <df> when sorted by each column, so that any subset of the rows can be sorted
+    quickly.
+
+    Args:
+        df: A Pandas dataframe.
+        columns (list): The columns to rank the rows by.
+
+    Returns:
+        A dictionary {column_id: rank}, where rank[position] is the position of the row when sorted by the column.
+    """
+    ranks = {}
+    for column_id in columns:
+        column = df[column_id]
+        if isinstance(column.dtype, pd.CategoricalDtype) and column.cat.categories.is_monotonic_increasing:
+            # The codes of sorted categories sort in the same order as the values
+            values = column.cat.codes.to_numpy()
         else:
-            dataframe = pd.DataFrame(data_dict)
+            values = column.to_numpy()
+        order = np.argsort(values, kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        ranks[column_id] = rank
+    return ranks
+
+
+def sort_data(positions, column_id, descending=False, ranks=None, values=None):
+    """
+    Sorts rows by a column.
+
+    Args:
+        positions (array): The positions of the rows to sort.
+        column_id (str): The column to sort by.
+        descending (bool): Whether to sort in descending order.
+        ranks (dict): The precomputed ranks of the rows of the dataset, see sort_ranks.
+        values (list): The values of each row to sort by, for a column without a precomputed sort order.
+
+    Returns:
+        An array of indexes into <positions>, in sorted order.
+    """
+    if ranks and column_id in ranks:
+        # The precomputed ranks are unique integers, which are much faster to sort than the values
+        keys = ranks[column_id][positions]
+    else:
+        keys = np.asarray(values, dtype=object)
+
+    order = np.argsort(keys, kind='stable')
+    if descending:
+        order = order[::-1]
+    return order
+
+
+@lru_cache(maxsize=None)
+def load_default_data():
+    """
+    Parses the default DATASET once, so that the layouts and callbacks share the same parsed data and indexes.
+    The parsed dataset is loaded from the snapshot next to DATASET if it is up to date, and the snapshot is saved
+    otherwise, so that the next start of the server does not parse DATASET again.
+
+    Returns:
+        The Dataset parsed from DATASET.
+    """
+    try:
+        snapshot = load_snapshot(DATASET)
+    except Exception as e:
+        print("[WARNING] Unable to load the snapshot of the dataset:", e)
+        snapshot = None
+
+    if snapshot is not None:
+        return Dataset.from_snapshot(*snapshot)
 
-        return dataframe.to_csv(None, encoding="ISO-8859-1")
+    dataset = parse_data(DATASET)
+    try:
+        save_snapshot(DATASET, *dataset.to_snapshot())
+    except Exception as e:
+        print("[WARNING] Unable to save a snapshot of the dataset:", e)
+    return dataset
@@ -0,0 +1,159 @@
+"""
+On-disk cache of parsed datasets, keyed by the SHA-256 hash of the uploaded files.
+
+Parsing a dataset and building its search index is slow, and users often upload the same files again. The parsed
+Dataset (with its search index and precomputed sort orders) is pickled here, so that uploading the same files again
+only has to load it. The least recently used files are deleted when the cache is larger than DATASET_CACHE_MAX_BYTES.
+"""
+
+import hashlib
+import os
+import pickle
+import re
+import tempfile
+from app import FILE_DIRECTORY
+
+DATASET_CACHE_DIRECTORY = os.path.join(FILE_DIRECTORY, 'dataset_cache')
+DATASET_CACHE_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+
+# Part of the file names, so that files pickled by an older version of Dataset are not loaded
+DATASET_CACHE_VERSION = 2
+
+_DIGEST = re.compile(r'^[0-9a-f]{64}$')
+
+
+def file_digest(blocks):
+    """
+    Hashes the content of an uploaded file.
+
+    Args:
+        blocks (iterable): The content of the file, as blocks of bytes.
+
+    Returns:
+        The SHA-256 hash (hex string) of the content.
+    """
+    digest = hashlib.sha256()
+    for block in blocks:
+        digest.update(block)
+    return digest.hexdigest()
+
+
+def upload_digest(file_digests):
+    """
+    Hashes the content of the files uploaded together, so that the same files in the same order have the same hash,
+    whether they were uploaded with dcc.Upload or to the /upload route.
+
+    Args:
+        file_digests (iterable): The hash of each file, returned by file_digest.
+
+    Returns:
+        The SHA-256 hash (hex string) of the upload.
+    """
+    return hashlib.sha256(','.join(file_digests).encode('ascii')).hexdigest()
+
+
+def cache_path(digest):
+    """
+    Returns:
+        The path of the cached file for the uploaded files with the SHA-256 hash <digest>.
+    """
+    return os.path.join(DATASET_CACHE_DIRECTORY, '{}.v{}.pickle'.format(digest, DATASET_CACHE_VERSION))
+
+
+def load_cached(digest):
+    """
+    Loads a cached dataset.
+
+    Args:
+        digest (str): The hash returned by upload_digest.
+
+    Returns:
+        (dataset, reports) stored with store_cached, or None if it is not cached.
+    """
+    # The digest may come from the browser, so it must not be able to escape the cache directory
+    if not digest or not _DIGEST.match(digest):
+        return None
+
+    path = cache_path(digest)
+    try:
+        with open(path, 'rb') as fp:
+            value = pickle.load(fp)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        # A corrupted file is deleted, so that the dataset is parsed and cached again
+        print("[WARNING] Unable to load cached dataset:", e)
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return None
+
+    # Mark it as recently used, so that it is evicted last
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return value
+
+
+def store_cached(digest, value, max_bytes=DATASET_CACHE_MAX_BYTES):
+    """
+    Caches a parsed dataset, then evicts the least recently used files until the cache is at most <max_bytes>.
+    The file is written to a temporary file first, and then renamed, so a partially written file is never loaded.
+
+    Args:
+        digest (str): The hash returned by upload_digest.
+        value: (dataset, reports), the Dataset and the report of each file returned by ingest.parse_file.
+        max_bytes (int): The maximum total size of the cached files.
+    """
+    try:
+        os.makedirs(DATASET_CACHE_DIRECTORY, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=DATASET_CACHE_DIRECTORY, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                pickle.dump(value, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, cache_path(digest))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        evict(max_bytes)
+
+    except Exception as e:
+        # The dataset is still usable, it is only parsed again on the next upload
+        print("[WARNING] Unable to cache dataset:", e)
+
+
+def evict(max_bytes=DATASET_CACHE_MAX_BYTES):
+    """
+    Deletes the least recently used cached files until the total size of the files is at most <max_bytes>.
+
+    Returns:
+        The number of files deleted.
+    """
+    files = []
+    for name in os.listdir(DATASET_CACHE_DIRECTORY):
+        if not name.endswith('.pickle'):
+            continue
+        path = os.path.join(DATASET_CACHE_DIRECTORY, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    deleted = 0
+    for _, size, path in files:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        deleted += 1
+
+    return deleted
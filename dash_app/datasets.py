@@ -0,0 +1,178 @@
+"""
+Server-side store of the datasets uploaded by users.
+
+Uploaded datasets are parsed once and kept here, keyed by the user's session. Only a small handle to the dataset is
+sent to the browser (in the hidden #intermediate-value element), instead of the whole dataset. Datasets expire when
+they have not been used for DATASET_TTL seconds, and the least recently used datasets are evicted when the store is
+larger than DATASET_STORE_MAX_BYTES.
+
+The handle of a dataset is the hash of the uploaded files, so that when the server runs several worker processes, a
+worker that does not have the dataset in memory loads it from the dataset cache on disk. The handle stored for each
+session is also saved to OWNER_DIRECTORY, so that a worker only loads a dataset from the cache for the session that
+uploaded it, and not for any session that knows its handle.
+"""
+
+import os
+import re
+import tempfile
+import time
+import uuid
+from app import FILE_DIRECTORY
+from cache import LRUCache
+from dataset_cache import load_cached
+
+DATASET_TTL = 60 * 60  # 1 hour
+DATASET_STORE_MAX_BYTES = 2 * 1024 ** 3  # 2 GB
+DATASET_STORE_MAX_SESSIONS = 1000
+# How often the owner file of a session is marked as used while its dataset is in memory
+OWNER_TOUCH_INTERVAL = 5 * 60  # 5 minutes
+
+OWNER_DIRECTORY = os.path.join(FILE_DIRECTORY, 'dataset_owners')
+
+_SESSION_ID = re.compile(r'^[0-9a-zA-Z-]{1,64}$')
+
+# session_id --> (handle, size in bytes, dataset)
+DATASETS = LRUCache(max_entries=DATASET_STORE_MAX_SESSIONS, max_size=DATASET_STORE_MAX_BYTES,
+                    sizeof=lambda entry: entry[1], ttl=DATASET_TTL)
+
+# session_id --> True, for the sessions whose owner file was marked as used within OWNER_TOUCH_INTERVAL seconds
+_OWNERS_TOUCHED = LRUCache(max_entries=DATASET_STORE_MAX_SESSIONS, sizeof=lambda touched: 0,
+                           ttl=OWNER_TOUCH_INTERVAL)
+
+
+def owner_path(session_id):
+    """
+    Returns:
+        The path of the file with the handle of the dataset stored for the session, or None if the session ID is not
+        valid.
+    """
+    # The session ID comes from the browser, so it must not be able to escape the owner directory
+    if not session_id or not _SESSION_ID.match(session_id):
+        return None
+    return os.path.join(OWNER_DIRECTORY, session_id + '.owner')
+
+
+def save_owner(session_id, handle):
+    """
+    Saves <handle> as the dataset of the session, so that any worker process can check it.
+    The file is written to a temporary file first, and then renamed, so a partially written file is never read.
+    """
+    path = owner_path(session_id)
+    if path is None:
+        return
+    try:
+        os.makedirs(OWNER_DIRECTORY, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=OWNER_DIRECTORY, suffix='.tmp')
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(handle)
+        os.replace(temp_path, path)
+        remove_expired_owners()
+    except OSError as e:
+        # The dataset is still usable by this worker
+        print("[WARNING] Unable to save dataset owner:", e)
+
+
+def is_owner(session_id, handle):
+    """
+    Returns:
+        True if <handle> is the dataset saved for the session, and it has been used within DATASET_TTL seconds.
+    """
+    path = owner_path(session_id)
+    if path is None:
+        return False
+    try:
+        with open(path) as fp:
+            owned = fp.read() == handle
+        if time.time() - os.stat(path).st_mtime > DATASET_TTL:
+            os.remove(path)
+            return False
+        # Mark it as recently used, like the dataset in DATASETS
+        os.utime(path)
+    except FileNotFoundError:
+        return False
+    return owned
+
+
+def touch_owner(session_id):
+    """
+    Marks the owner file of the session as used, at most once every OWNER_TOUCH_INTERVAL seconds, so that it does not
+    expire while the session only uses this worker.
+    """
+    if _OWNERS_TOUCHED.peek(session_id):
+        return
+    path = owner_path(session_id)
+    if path is None:
+        return
+    try:
+        os.utime(path)
+    except OSError:
+        # The dataset is still usable by this worker
+        pass
+    _OWNERS_TOUCHED.put(session_id, True)
+
+
+def remove_expired_owners(max_age=DATASET_TTL):
+    """
+    Deletes the owner files that have not been used for <max_age> seconds.
+
+    Returns:
+        The number of files deleted.
+    """
+    deleted = 0
+    now = time.time()
+    for name in os.listdir(OWNER_DIRECTORY):
+        path = os.path.join(OWNER_DIRECTORY, name)
+        try:
+            if now - os.stat(path).st_mtime > max_age:
+                os.remove(path)
+                deleted += 1
+        except FileNotFoundError:
+            pass
+    return deleted
+
+
+def store_dataset(session_id, dataset, digest=None):
+    """
+    Stores the dataset uploaded in a session, replacing the session's previous dataset.
+
+    Args:
+        session_id (str): The ID of the user's session.
+        dataset (Dataset): The parsed dataset.
+        digest (str): The hash of the uploaded files, under which the dataset is stored in the dataset cache.
+
+    Returns:
+        A handle (str) to retrieve the dataset with.
+    """
+    handle = digest or uuid.uuid4().hex
+    DATASETS.put(session_id, (handle, dataset.nbytes, dataset))
+    save_owner(session_id, handle)
+    _OWNERS_TOUCHED.put(session_id, True)
+    return handle
+
+
+def get_dataset(session_id, handle):
+    """
+    Retrieves a dataset stored with store_dataset.
+
+    Args:
+        session_id (str): The ID of the user's session.
+        handle (str): The handle returned by store_dataset.
+
+    Returns:
+        The Dataset, or None if it has expired, been replaced, or was not stored for the session.
+    """
+    entry = DATASETS.get(session_id)
+    if entry is not None and entry[0] == handle:
+        touch_owner(session_id)
+        return entry[2]
+
+    # The dataset may have been stored by another worker process, for this session only
+    if not is_owner(session_id, handle):
+        return None
+    cached = load_cached(handle)
+    if cached is None:
+        return None
+    dataset = cached[0]
+    DATASETS.put(session_id, (handle, dataset.nbytes, dataset))
+    _OWNERS_TOUCHED.put(session_id, True)
+    return dataset
@@ -0,0 +1,165 @@
+"""
+Stores exported files (search results, graphs) under FILE_DIRECTORY, so that they can be served to the user.
+
+Each session has its own directory, and each file is named after the SHA-256 hash of its content, so concurrent exports
+never overwrite each other, and identical exports are only stored once. Files are written to a temporary file first,
+and then renamed, so a file is never served while it is being written. A background thread deletes old files, and the
+oldest files once the total size is too large.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from app import FILE_DIRECTORY
+from cache import LRUCache
+
+EXPORT_DIRECTORY = os.path.join(FILE_DIRECTORY, 'exports')
+
+EXPORT_MAX_AGE = 60 * 60  # 1 hour
+EXPORT_MAX_BYTES = 1024 ** 3  # 1 GB
+EXPORT_GC_INTERVAL = 5 * 60  # 5 minutes
+
+# Export key --> path of the stored file, so that repeated downloads do not generate the file again
+ARTIFACTS = LRUCache(max_entries=1000, sizeof=lambda path: 0)
+
+_SESSION_ID = re.compile(r'^[0-9a-zA-Z-]{1,64}$')
+
+
+def session_directory(session_id):
+    """
+    Args:
+        session_id (str): The ID of the user's session.
+
+    Returns:
+        The directory that the exports of the session are stored in.
+    """
+    # The session ID comes from the browser, so it must not be able to escape the export directory
+    if not session_id or not _SESSION_ID.match(session_id):
+        session_id = 'anonymous'
+    return os.path.join(EXPORT_DIRECTORY, session_id)
+
+
+def write_artifact(session_id, chunks, suffix):
+    """
+    Writes an exported file atomically, naming it after the SHA-256 hash of its content.
+
+    Args:
+        session_id (str): The ID of the user's session.
+        chunks (iterable): The content of the file, as strings.
+        suffix (str): The file extension, e.g. '.csv'.
+
+    Returns:
+        The path of the stored file.
+    """
+    directory = session_directory(session_id)
+    os.makedirs(directory, exist_ok=True)
+
+    digest = hashlib.sha256()
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            for chunk in chunks:
+                data = chunk.encode('utf-8')
+                digest.update(data)
+                fp.write(data)
+
+        path = os.path.join(directory, digest.hexdigest() + suffix)
+        # Replacing is atomic, so readers see either the old or the new file, never a partial one
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+    return path
+
+
+def get_artifact(key, session_id, generate, suffix):
+    """
+    Gets the stored file for an export, writing it with write_artifact if it is not stored yet.
+
+    Args:
+        key (tuple): Identifies the content of the export.
+        session_id (str): The ID of the user's session.
+        generate (function): Returns the content of the file, as an iterable of strings.
+        suffix (str): The file extension, e.g. '.csv'.
+
+    Returns:
+        The path of the stored file.
+    """
+    key = (session_directory(session_id),) + tuple(key)
+    path = ARTIFACTS.get(key)
+    if path is not None and os.path.exists(path):
+        # Mark it as recently used, so that it is not collected while it is being downloaded
+        os.utime(path)
+        return path
+
+    path = write_artifact(session_id, generate(), suffix)
+    ARTIFACTS.put(key, path)
+    return path
+
+
+def collect_garbage(max_age=EXPORT_MAX_AGE, max_bytes=EXPORT_MAX_BYTES):
+    """
+    Deletes exported files that are older than <max_age> seconds, then the oldest files until the total size of the
+    files is at most <max_bytes>. Empty session directories are deleted too.
+
+    Returns:
+        The number of files deleted.
+    """
+    now = time.time()
+    files = []
+    deleted = 0
+
+    for directory, _, names in os.walk(EXPORT_DIRECTORY):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+    files.sort()
+    total = sum(size for _, size, _ in files)
+    for mtime, size, path in files:
+        if now - mtime <= max_age and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        deleted += 1
+
+    for directory, subdirectories, names in os.walk(EXPORT_DIRECTORY, topdown=False):
+        if directory != EXPORT_DIRECTORY and not subdirectories and not names:
+            try:
+                os.rmdir(directory)
+            except OSError:
+                # A new export was written to it in the meantime
+                pass
+
+    return deleted
+
+
+def start_garbage_collector(interval=EXPORT_GC_INTERVAL):
+    """
+    Starts a background thread that calls collect_garbage every <interval> seconds.
+
+    Returns:
+        The thread.
+    """
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                collect_garbage()
+            except Exception as e:
+                print("[WARNING] Unable to delete old exports:", e)
+
+    thread = threading.Thread(target=run, name='export-gc', daemon=True)
+    thread.start()
+    return thread
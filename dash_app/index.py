@@ -2,16 +2,18 @@
 Layout for '/' (homepage)
 """
 
-from data import parse_data, DATASET
+from data import load_default_data
 import dash_html_components as html
 import dash_core_components as dcc
 import dash_table as dt
 import pandas as pd
 
 # Initialize data for initial layout
-df, DATA, CATEGORIES, COLUMNS = parse_data(DATASET)
+DATASET = load_default_data()
 
 PIXEL_FOR_CHAR = 5
+# Number of rows sent to the browser at a time, the table is paged and sorted on the server
+PAGE_SIZE = 50
 
 
 def create_conditional_style(df):
@@ -28,7 +30,7 @@ def create_conditional_style(df):
 table = dt.DataTable(
     fixed_columns={'headers': True, 'data': 4},
     style_table={'minWidth': '100%'},
-    style_data_conditional=create_conditional_style(df),
+    style_data_conditional=create_conditional_style(DATASET.df),
     style_cell={
         'textAlign': 'left',
         'minWidth': '100%',
@@ -36,9 +38,14 @@ table = dt.DataTable(
         'textOverflow': 'ellipsis',
     },
     id='table-index',
-    columns=COLUMNS,
-    data=DATA,
-    sort_action="native"
+    columns=DATASET.columns,
+    data=DATASET.rows(DATASET.positions['all'][:PAGE_SIZE]),
+    page_action="custom",
+    page_current=0,
+    page_size=PAGE_SIZE,
+    sort_action="custom",
+    sort_mode="single",
+    sort_by=[]
 )
 
 loading_wrapper_table = dcc.Loading(
@@ -0,0 +1,112 @@
+"""
+Parses the files uploaded with dcc.Upload.
+
+When several files are uploaded at once, they are parsed by a pool of threads shared by every upload, and the columns
+of the parsed files are then concatenated into a single dataset. A file that cannot be parsed is reported, without
+failing the others.
+"""
+
+import base64
+import io
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from data import DATASET_COLUMNS, read_dataset, parse_data
+import numpy as np
+import pandas as pd
+
+# Number of files parsed at the same time. Threads rather than processes, as forking the multithreaded server workers
+# is unsafe, and building the search index of the merged files takes most of the time of an upload anyway
+INGEST_THREADS = min(4, os.cpu_count() or 1)
+
+INGEST_EXECUTOR = ThreadPoolExecutor(max_workers=INGEST_THREADS, thread_name_prefix='parse-upload')
+
+
+def parse_contents(contents, filename, date):
+    """
+    Reads user-submitted dataset.
+
+    Args:
+        contents (str): A contents string generated from the user-uploaded file.
+        filename (str): The filename of the user-uploaded file.
+        date (str): The date of the user-uploaded file.
+
+    Returns:
+        A Pandas dataframe of the dataset, to be processed with parse_data.
+    """
+    content_type, content_string = contents.split(',')
+    decoded = base64.b64decode(content_string)
+
+    if 'csv' in filename:
+        # Assume that the user uploaded a CSV file
+        df = read_dataset(io.StringIO(decoded.decode("ISO-8859-1")))
+    else:
+        raise ValueError("Only CSV format supported.")
+
+    return df
+
+
+def parse_file(contents, filename, date):
+    """
+    Parses one uploaded file.
+
+    Args:
+        contents (str): A contents string generated from the user-uploaded file.
+        filename (str): The filename of the user-uploaded file.
+        date (str): The date of the user-uploaded file.
+
+    Returns:
+        (columns, report), where columns is a dictionary {column: array of values}, or None if the file could not be
+        parsed, and report is a dictionary {'filename', 'rows', 'seconds', 'error'}.
+    """
+    start = time.perf_counter()
+    try:
+        df = parse_contents(contents, filename, date)
+        columns = {column: df[column].to_numpy(dtype=object) for column in DATASET_COLUMNS}
+        rows, error = len(df), None
+    except Exception as e:
+        columns, rows, error = None, 0, str(e)
+
+    return columns, {'filename': filename, 'rows': rows, 'seconds': time.perf_counter() - start, 'error': error}
+
+
+def merge_columns(parsed):
+    """
+    Concatenates the columns of parsed files.
+
+    Args:
+        parsed (list): A list of dictionaries {column: array of values} returned by parse_file.
+
+    Returns:
+        A Pandas dataframe with the rows of every file, in order.
+    """
+    return pd.DataFrame({column: np.concatenate([columns[column] for columns in parsed])
+                         for column in DATASET_COLUMNS})
+
+
+def parse_uploads(list_of_contents, list_of_names, list_of_dates):
+    """
+    Parses the files of an upload, in parallel when there is more than one file.
+
+    Args:
+        list_of_contents (list): A list of user-uploaded file contents.
+        list_of_names (list): A list of user-uploaded file names.
+        list_of_dates (list): A list of user-uploaded file dates.
+
+    Returns:
+        (dataset, reports), where dataset is the Dataset combining every file that could be parsed, or None if no file
+        could be parsed, and reports is the list of reports of each file returned by parse_file.
+    """
+    files = list(zip(list_of_contents, list_of_names, list_of_dates))
+
+    if len(files) == 1:
+        results = [parse_file(*files[0])]
+    else:
+        futures = [INGEST_EXECUTOR.submit(parse_file, *file) for file in files]
+        results = [future.result() for future in futures]
+
+    parsed = [columns for columns, _ in results if columns is not None]
+    reports = [report for _, report in results]
+    if not parsed:
+        return None, reports
+    return parse_data(merge_columns(parsed)), reports
@@ -7,8 +7,8 @@ allowing the user to download exported results.
 # -*- coding: utf-8 -*-
 
 from app import app, server, FILE_DIRECTORY
-from flask import send_from_directory
-from urllib.parse import quote as urlquote
+from flask import send_from_directory, request
+from urllib.parse import quote as urlquote, urlencode
 from index import index_layout
 from stats import stats_layout
 from predict import predict_layout
@@ -17,24 +17,30 @@ import dash_core_components as dcc
 from dash.dependencies import Input, Output
 
 import base64
-import os
+import uuid
 
 
-def save_file(name, content):
-    """Store a file on the Dash server."""
-    with open(os.path.join(FILE_DIRECTORY, name), "wb") as fp:
-        fp.write(content.encode('utf-8'))
+# Exports that are generated when they are downloaded, instead of being saved to the file directory.
+# Maps a file name to a function that takes the query parameters of the download link, and returns a response.
+EXPORTS = {}
 
 
 @server.route("/download/<path:path>")
 def download(path):
-    """Serve a file from the file directory."""
+    """Generate an export, or serve a file from the file directory."""
+    export = EXPORTS.get(path)
+    if export is not None:
+        return export(request.args)
     return send_from_directory(FILE_DIRECTORY, path, as_attachment=True)
 
 
-def file_download_link(filename):
-    """Create a Plotly Dash 'A' element that downloads a file from the app."""
+def file_download_link(filename, **params):
+    """Create the URL of a link that downloads a file from the app.
+    The keyword arguments are passed to the export as query parameters."""
     location = "/download/{}".format(urlquote(filename))
+    params = {name: value for name, value in params.items() if value is not None}
+    if params:
+        location += "?" + urlencode(params)
     return location
 
 
@@ -80,10 +86,46 @@ upload = dcc.Upload(
     multiple=True
 )
 
+# Large datasets are posted to the /upload route by assets/uploads.js, which sends the file straight from disk instead of
+# reading it into the page like dcc.Upload, and the server streams it to disk and parses it in the background
+upload_large = html.Div(
+    [
+        'Drag and Drop or ',
+        html.A('Select a Large Dataset (.csv)', id='upload-large-select', style={'cursor': 'pointer'}),
+        # The session ID that the dataset is uploaded for, read by assets/uploads.js
+        html.Div(id='upload-large-session', style={'display': 'none'}),
+        # Clicked by assets/uploads.js when an upload starts or fails, so that the callbacks read its state
+        html.Button(id='upload-large-notify', style={'display': 'none'})
+    ],
+    id='upload-large',
+    style={
+        'width': '100%',
+        'height': '40px',
+        'lineHeight': '40px',
+        'borderWidth': '1px',
+        'borderStyle': 'dashed',
+        'borderRadius': '5px',
+        'textAlign': 'center',
+        'margin': '10px'
+    }
+)
+
+# Files parsed by the last upload, and progress of the dataset uploaded to the /upload route. The upload-interval only
+# polls the progress while an upload is running.
+upload_progress = html.Div(
+    [
+        html.Div(id='upload-report', style={'margin': '0 10px', 'color': 'grey'}),
+        html.Div(id='upload-progress', style={'margin': '0 10px', 'color': 'grey'}),
+        dcc.Store(id='upload-started'),
+        dcc.Store(id='upload-previous'),
+        dcc.Interval(id='upload-interval', interval=2000, disabled=True)
+    ]
+)
+
 search_bar = dcc.Input(
     id="search",
     type='text',
-    placeholder="Search",
+    placeholder="Search (separate multiple terms with |)",
     style={
         "width": "100%",
         "margin": "10px",
@@ -137,18 +179,32 @@ dataset_top = [
     toggle_language,
     button_predict,
     upload,
+    upload_large,
+    upload_progress,
     user_input,
     intermediate_value
 ]
 
 classifier_top = heading
 
-# Dynamic app layout based on URL
-app.layout = html.Div([
-    dcc.Location(id='url', refresh=False),
-    html.Div(id='page-top', style={"font-family": 'Palatino, "Palatino Linotype", "Palatino LT STD"'}),
-    html.Div(id='page-content', style={"font-family": 'Palatino, "Palatino Linotype", "Palatino LT STD"'})
-])
+def serve_layout():
+    """
+    Creates the app layout on every page load, so that each browser tab gets its own session ID.
+    The session ID identifies the user's searches on the server.
+
+    Returns:
+        A Dash HTML components object representing the app layout.
+    """
+    # Dynamic app layout based on URL
+    return html.Div([
+        dcc.Store(id='session-id', data=str(uuid.uuid4())),
+        dcc.Location(id='url', refresh=False),
+        html.Div(id='page-top', style={"font-family": 'Palatino, "Palatino Linotype", "Palatino LT STD"'}),
+        html.Div(id='page-content', style={"font-family": 'Palatino, "Palatino Linotype", "Palatino LT STD"'})
+    ])
+
+
+app.layout = serve_layout
 
 
 @app.callback([Output('page-top', 'children'), Output('page-content', 'children')],
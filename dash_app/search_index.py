@@ -0,0 +1,151 @@
+"""
+In-memory n-gram (trigram) index over the email texts of a dataset.
+
+The index maps every n-gram to a posting list of the rows whose text contains it. A query can only match a row if
+every n-gram of the query occurs in that row, so intersecting the posting lists of the query's n-grams gives a small
+set of candidate rows. The candidates still have to be verified with the Boyer-Moore algorithm, as the n-grams may
+occur in the wrong order or far apart.
+"""
+
+from array import array
+import numpy as np
+
+NGRAM_SIZE = 3
+
+
+def ngrams(text, n=NGRAM_SIZE):
+    """
+    Generates the set of distinct n-grams of <text>.
+
+    Args:
+        text (str): A string of text.
+        n (int): The length of each n-gram.
+
+    Returns:
+        A set of substrings of <text> of length <n>.
+    """
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class _FlatPostings(object):
+    """Posting lists stored as slices of a single array, looked up like the dictionary of NgramIndex.postings."""
+
+    def __init__(self, grams, n, offsets, postings):
+        self.slots = {grams[i:i + n]: slot for slot, i in enumerate(range(0, len(grams), n))}
+        self.offsets = offsets
+        self.postings = postings
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __iter__(self):
+        return iter(self.slots)
+
+    def __getitem__(self, gram):
+        slot = self.slots[gram]
+        return self.postings[self.offsets[slot]:self.offsets[slot + 1]]
+
+    def get(self, gram, default=None):
+        slot = self.slots.get(gram)
+        if slot is None:
+            return default
+        return self.postings[self.offsets[slot]:self.offsets[slot + 1]]
+
+
+class NgramIndex(object):
+    """Posting-list index from n-grams to row numbers."""
+
+    def __init__(self, texts, n=NGRAM_SIZE):
+        """
+        Builds the index.
+
+        Args:
+            texts (iterable): The text of each row, in row order.
+            n (int): The length of each n-gram.
+        """
+        self.n = n
+        self.size = 0
+        self.postings = {}
+
+        for row_number, text in enumerate(texts):
+            for gram in ngrams(text, n):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    # Compact array of unsigned ints instead of a list of Python ints
+                    posting = self.postings[gram] = array('I')
+                posting.append(row_number)
+            self.size += 1
+
+    def __len__(self):
+        return self.size
+
+    def to_arrays(self):
+        """
+        Flattens the index into arrays, e.g. to save it to a file.
+
+        Returns:
+            (grams, offsets, postings), where grams is the string of every n-gram joined together, and the posting
+            list of the i-th n-gram is postings[offsets[i]:offsets[i + 1]].
+        """
+        grams = list(self.postings)
+        offsets = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum([len(self.postings[gram]) for gram in grams], out=offsets[1:])
+        postings = np.empty(offsets[-1], dtype=np.uint32)
+        for gram, start, end in zip(grams, offsets[:-1].tolist(), offsets[1:].tolist()):
+            postings[start:end] = self.postings[gram]
+        return ''.join(grams), offsets, postings
+
+    @classmethod
+    def from_arrays(cls, grams, offsets, postings, size, n=NGRAM_SIZE):
+        """
+        Restores an index flattened by to_arrays, without copying the posting lists.
+
+        Args:
+            grams (str): The string of every n-gram joined together.
+            offsets (array): The offsets of each posting list in <postings>, as 64-bit integers.
+            postings (array): The posting lists, as 32-bit unsigned integers (e.g. a memory-mapped array).
+            size (int): The number of rows in the index.
+            n (int): The length of each n-gram.
+
+        Returns:
+            An NgramIndex.
+        """
+        index = cls([], n)
+        index.size = size
+        # Memoryviews of the arrays, so that the posting lists are slices that yield Python ints, like array('I')
+        offsets = memoryview(np.ascontiguousarray(offsets, dtype=np.int64)).cast('B').cast('q')
+        postings = memoryview(np.ascontiguousarray(postings, dtype=np.uint32)).cast('B').cast('I')
+        index.postings = _FlatPostings(grams, n, offsets, postings)
+        return index
+
+    def candidates(self, query):
+        """
+        Finds the rows that may contain <query>.
+
+        Args:
+            query (str): A user query.
+
+        Returns:
+            A sorted list of row numbers that may contain <query>, or None if <query> is too short to narrow down
+            the rows (every row is a candidate).
+        """
+        if len(query) < self.n:
+            return None
+
+        postings = []
+        for gram in ngrams(query, self.n):
+            posting = self.postings.get(gram)
+            if posting is None:
+                # An n-gram that occurs nowhere means that the query occurs nowhere
+                return []
+            postings.append(posting)
+
+        # Intersect the smallest posting lists first to keep the candidate set small
+        postings.sort(key=len)
+        result = set(postings[0])
+        for posting in postings[1:]:
+            if not result:
+                break
+            result.intersection_update(posting)
+
+        return sorted(result)
@@ -0,0 +1,173 @@
+"""
+Binary snapshot of a parsed dataset, saved next to its CSV file, so that the server does not parse the CSV file (and
+build the search index) again every time it starts.
+
+A snapshot file contains a JSON header followed by the raw data of numpy arrays. The file is memory-mapped when it is
+loaded, so the arrays (the sort orders, the codes of the categorical columns, the posting lists of the search index...)
+are not copied, and are shared by every process that loads the same snapshot. Lists of strings are stored as a single
+UTF-8 string and the offset of each string in it.
+
+The header records the size, modification time and SHA-256 hash of the CSV file. The snapshot is only loaded if they
+all match the CSV file, so it is invalidated automatically when the CSV file changes.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import numpy as np
+
+SNAPSHOT_MAGIC = b'SPAMSNAP'
+# Snapshots written by another version are not loaded
+SNAPSHOT_VERSION = 1
+# Alignment of each array in the file, in bytes
+SNAPSHOT_ALIGNMENT = 64
+
+
+def snapshot_path(source):
+    """
+    Returns:
+        The path of the snapshot of the CSV file <source>.
+    """
+    return source + '.snapshot'
+
+
+def source_signature(source):
+    """
+    Args:
+        source (str): The path of a CSV file.
+
+    Returns:
+        A dictionary of the size, modification time and SHA-256 hash of the file.
+    """
+    digest = hashlib.sha256()
+    with open(source, 'rb') as fp:
+        for block in iter(lambda: fp.read(1024 ** 2), b''):
+            digest.update(block)
+    stat = os.stat(source)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+
+
+def _align(offset):
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+
+def encode_strings(strings):
+    """
+    Encodes a list of strings as arrays.
+
+    Returns:
+        (data, offsets), where data is the UTF-8 encoding of the strings joined together, as an array of bytes, and
+        the i-th string is the characters offsets[i]:offsets[i + 1] of the decoded data.
+    """
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in strings], out=offsets[1:])
+    data = np.frombuffer(''.join(strings).encode('utf-8', 'surrogatepass'), dtype=np.uint8)
+    return data, offsets
+
+
+def decode_strings(data, offsets):
+    """
+    Decodes a list of strings encoded by encode_strings.
+
+    Returns:
+        The list of strings.
+    """
+    text = data.tobytes().decode('utf-8', 'surrogatepass')
+    bounds = offsets.tolist()
+    return [text[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def save_snapshot(source, arrays, strings, meta):
+    """
+    Saves a snapshot of the dataset parsed from <source>.
+    The snapshot is written to a temporary file first, and then renamed, so a partially written snapshot is never
+    loaded.
+
+    Args:
+        source (str): The path of the CSV file.
+        arrays (dict): The numpy arrays to save, by name.
+        strings (dict): The lists of strings to save, by name.
+        meta (dict): Other values to save, which can be converted to JSON.
+    """
+    arrays = dict(arrays)
+    for name, values in strings.items():
+        arrays[name + '.data'], arrays[name + '.offsets'] = encode_strings(values)
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = arrays[name] = np.ascontiguousarray(array)
+        if array.dtype.hasobject:
+            raise TypeError("Cannot save the object array '{}' in a snapshot.".format(name))
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    header = json.dumps({
+        'version': SNAPSHOT_VERSION,
+        'source': source_signature(source),
+        'meta': meta,
+        'arrays': layout,
+        'strings': list(strings)
+    }).encode('utf-8')
+    # The arrays start after the magic bytes, the length of the header, and the header
+    start = _align(len(SNAPSHOT_MAGIC) + 8 + len(header))
+
+    path = snapshot_path(source)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(SNAPSHOT_MAGIC)
+            fp.write(len(header).to_bytes(8, 'little'))
+            fp.write(header)
+            for name, array in arrays.items():
+                fp.seek(start + layout[name]['offset'])
+                # Written as bytes, as the buffer of some dtypes (e.g. datetime64) cannot be written directly
+                fp.write(array.reshape(-1).view(np.uint8).data)
+            fp.truncate(start + offset)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def load_snapshot(source):
+    """
+    Loads the snapshot of the dataset parsed from <source>, if it is up to date.
+
+    Args:
+        source (str): The path of the CSV file.
+
+    Returns:
+        (arrays, strings, meta) saved by save_snapshot, where the arrays are read-only and memory-mapped, or None if
+        there is no snapshot, or it was saved by another version, or the CSV file has changed since.
+    """
+    path = snapshot_path(source)
+    try:
+        with open(path, 'rb') as fp:
+            if fp.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None
+            length = int.from_bytes(fp.read(8), 'little')
+            header = json.loads(fp.read(length).decode('utf-8'))
+            if header['version'] != SNAPSHOT_VERSION or header['source'] != source_signature(source):
+                return None
+            # The mapping stays open as long as the arrays use it
+            buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return None
+
+    start = _align(len(SNAPSHOT_MAGIC) + 8 + length)
+    arrays = {}
+    for name, layout in header['arrays'].items():
+        dtype = np.dtype(layout['dtype'])
+        count = int(np.prod(layout['shape']))
+        if not count:
+            arrays[name] = np.empty(layout['shape'], dtype=dtype)
+            continue
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count,
+                                     offset=start + layout['offset']).reshape(layout['shape'])
+
+    strings = {name: decode_strings(arrays.pop(name + '.data'), arrays.pop(name + '.offsets'))
+               for name in header['strings']}
+    return arrays, strings, header['meta']
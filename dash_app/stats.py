@@ -2,8 +2,40 @@
 Layout for '/stats'
 """
 
+from data import load_default_data
 import dash_html_components as html
 import dash_core_components as dcc
+import numpy as np
+
+# Maximum number of labelled dates on the date slider
+MAX_DATE_MARKS = 10
+
+
+def date_slider_properties(dataset):
+    """
+    Computes the bounds and marks of the date slider from the dates in <dataset>.
+    The slider values are days since 1970-01-01.
+
+    Args:
+        dataset (Dataset): A parsed dataset.
+
+    Returns:
+        A dictionary of the 'min', 'max', 'marks' and 'value' properties of the slider. The value selects every date.
+    """
+    first_day, last_day = dataset.date_bounds()
+    if first_day is None:
+        return {'min': 0, 'max': 0, 'marks': {}, 'value': [0, 0]}
+
+    start = int(first_day.astype(np.int64))
+    end = int(last_day.astype(np.int64))
+    step = max(-(-(end - start) // MAX_DATE_MARKS), 1)
+
+    marks = {}
+    for day in list(range(start, end, step)) + [end]:
+        date = np.datetime64(day, 'D').item()
+        marks[day] = "{}/{}/{}".format(date.day, date.month, date.year)
+
+    return {'min': start, 'max': end, 'marks': marks, 'value': [start, end]}
 
 
 heading_2 = html.Header(
@@ -43,12 +75,9 @@ toolbar = html.Div(
 
 date_picker = dcc.RangeSlider(
     id="date-slider",
-    marks={date: "{}/10/2020".format(date) for date in range(1, 7)},
     updatemode="mouseup",
     allowCross=False,
-    min=1,
-    max=6,
-    value=[2, 5]
+    **date_slider_properties(load_default_data())
 )
 
 stats_layout = html.Div(
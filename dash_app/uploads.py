@@ -0,0 +1,291 @@
+"""
+Upload route for large datasets, outside of the Dash callbacks.
+
+dcc.Upload sends the file base64-encoded inside the callback request, so the whole file is decoded in memory. Here, the
+file is streamed to disk instead, and then parsed in chunks of rows in a background thread. The progress of each upload
+can be polled, and the parsed dataset is stored for the user's session, so that the search and stats callbacks use it.
+The progress is saved to a file, so that it can be polled from any worker process of the server.
+
+Files selected in the large dataset box of the app are posted here by assets/uploads.js. The route can also be used
+directly:
+    curl -F "file=@emails.csv" "http://127.0.0.1:8050/upload?session=<session ID>"
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from app import server, FILE_DIRECTORY
+from data import DATASET_COLUMNS, parse_data, read_dataset_chunks
+from datasets import DATASET_TTL, store_dataset
+from dataset_cache import upload_digest, load_cached, store_cached
+from flask import request, jsonify
+import pandas as pd
+
+UPLOAD_DIRECTORY = os.path.join(FILE_DIRECTORY, 'uploads')
+PROGRESS_DIRECTORY = os.path.join(UPLOAD_DIRECTORY, 'progress')
+
+# Size of each block of the request body written to disk
+UPLOAD_BLOCK_BYTES = 1024 ** 2  # 1 MB
+# Number of rows parsed at a time
+INGEST_CHUNK_ROWS = 50000
+# Number of uploads parsed at the same time, as each parsed dataset is held in memory
+INGEST_WORKERS = 2
+
+INGEST_EXECUTOR = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix='ingest')
+
+_ID = re.compile(r'^[0-9a-zA-Z-]{1,64}$')
+
+
+class UploadProgress(object):
+    """
+    Progress of an upload, updated by the threads receiving and parsing the file.
+
+    The status is 'receiving' while the file is written to disk, 'parsing' while its rows are parsed, then either
+    'done' (and handle is the handle of the stored dataset) or 'error'.
+    """
+
+    def __init__(self, session_id, filename, bytes_total=None):
+        self.upload_id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.filename = filename
+        self.status = 'receiving'
+        self.bytes_total = bytes_total
+        self.bytes_received = 0
+        self.bytes_parsed = 0
+        self.rows = 0
+        self.digest = None
+        self.handle = None
+        self.error = None
+
+    def percent(self):
+        """
+        Returns:
+            The percentage of the current stage (receiving or parsing) that is complete, or None if it is unknown.
+        """
+        if self.status == 'receiving':
+            done, total = self.bytes_received, self.bytes_total
+        else:
+            done, total = self.bytes_parsed, self.bytes_received
+        if not total:
+            return None
+        return min(100, int(100 * done / total))
+
+    def save(self):
+        """
+        Saves the progress to PROGRESS_DIRECTORY, as the upload with ID upload_id and the latest upload of the session.
+        Files are written to a temporary file first, and then renamed, so a partially written file is never read.
+        """
+        os.makedirs(PROGRESS_DIRECTORY, exist_ok=True)
+        for name, content in [(self.upload_id + '.json', json.dumps(vars(self))),
+                              (self.session_id + '.latest', self.upload_id)]:
+            fd, temp_path = tempfile.mkstemp(dir=PROGRESS_DIRECTORY, suffix='.tmp')
+            with os.fdopen(fd, 'w') as fp:
+                fp.write(content)
+            os.replace(temp_path, os.path.join(PROGRESS_DIRECTORY, name))
+
+    @classmethod
+    def load(cls, upload_id):
+        """
+        Args:
+            upload_id (str): The ID of an upload.
+
+        Returns:
+            The UploadProgress saved for the upload, or None if it is unknown.
+        """
+        # The ID comes from the browser, so it must not be able to escape the progress directory
+        if not upload_id or not _ID.match(upload_id):
+            return None
+        try:
+            with open(os.path.join(PROGRESS_DIRECTORY, upload_id + '.json')) as fp:
+                state = json.load(fp)
+        except FileNotFoundError:
+            return None
+        progress = cls.__new__(cls)
+        progress.__dict__.update(state)
+        return progress
+
+    def to_dict(self):
+        return {
+            'upload_id': self.upload_id,
+            'status': self.status,
+            'percent': self.percent(),
+            'bytes_received': self.bytes_received,
+            'rows': self.rows,
+            'dataset': self.handle,
+            'error': self.error
+        }
+
+
+def latest_upload(session_id):
+    """
+    Args:
+        session_id (str): The ID of the user's session.
+
+    Returns:
+        The UploadProgress of the session's latest upload, or None.
+    """
+    if not session_id or not _ID.match(session_id):
+        return None
+    try:
+        with open(os.path.join(PROGRESS_DIRECTORY, session_id + '.latest')) as fp:
+            upload_id = fp.read()
+    except FileNotFoundError:
+        return None
+    return UploadProgress.load(upload_id)
+
+
+def remove_old_progress(max_age=DATASET_TTL):
+    """
+    Deletes the progress of uploads that have not been updated for <max_age> seconds.
+    """
+    now = time.time()
+    for name in os.listdir(PROGRESS_DIRECTORY):
+        path = os.path.join(PROGRESS_DIRECTORY, name)
+        try:
+            if now - os.stat(path).st_mtime > max_age:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def receive_file(stream, progress):
+    """
+    Writes an uploaded file to UPLOAD_DIRECTORY, one block at a time.
+
+    Args:
+        stream: A file-like object of the uploaded file.
+        progress (UploadProgress): Updated with the number of bytes written.
+
+    Returns:
+        The path of the written file.
+    """
+    os.makedirs(UPLOAD_DIRECTORY, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=UPLOAD_DIRECTORY, suffix='.csv')
+    # Hash the file while it is written, to look it up in the dataset cache
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            while True:
+                block = stream.read(UPLOAD_BLOCK_BYTES)
+                if not block:
+                    break
+                fp.write(block)
+                digest.update(block)
+                progress.bytes_received += len(block)
+                progress.save()
+    except BaseException:
+        os.remove(path)
+        raise
+
+    progress.digest = upload_digest([digest.hexdigest()])
+    return path
+
+
+def ingest_file(path, progress):
+    """
+    Parses an uploaded file in chunks of INGEST_CHUNK_ROWS rows, and stores the dataset for the session.
+    If the same file was parsed before, the dataset is loaded from the dataset cache instead.
+    Only the values of each column are kept from each chunk, so the parsed text of a single chunk is in memory at a
+    time. The file is deleted afterwards.
+
+    Args:
+        path (str): The path of the file written by receive_file.
+        progress (UploadProgress): Updated with the number of rows parsed, and the handle of the stored dataset.
+    """
+    progress.status = 'parsing'
+    progress.save()
+    start = time.perf_counter()
+    try:
+        # The same file was parsed before if its hash is in the dataset cache
+        cached = load_cached(progress.digest)
+        if cached is not None:
+            dataset, reports = cached
+            progress.rows = sum(report['rows'] for report in reports)
+            progress.bytes_parsed = progress.bytes_received
+            progress.handle = store_dataset(progress.session_id, dataset, progress.digest)
+            progress.status = 'done'
+            return
+
+        columns = {column: [] for column in DATASET_COLUMNS}
+        with open(path, 'rb') as fp:
+            for chunk in read_dataset_chunks(fp, INGEST_CHUNK_ROWS):
+                for column in DATASET_COLUMNS:
+                    columns[column].extend(chunk[column].tolist())
+                progress.rows += len(chunk)
+                progress.bytes_parsed = fp.tell()
+                progress.save()
+
+        dataset = parse_data(pd.DataFrame(columns, columns=DATASET_COLUMNS))
+        report = {'filename': progress.filename, 'rows': progress.rows, 'seconds': time.perf_counter() - start,
+                  'error': None}
+        store_cached(progress.digest, (dataset, [report]))
+        progress.handle = store_dataset(progress.session_id, dataset, progress.digest)
+        progress.status = 'done'
+
+    except Exception as e:
+        print(e)
+        progress.error = 'Unable to parse the file, please check that it is a valid dataset.'
+        progress.status = 'error'
+
+    finally:
+        progress.save()
+        os.remove(path)
+
+
+@server.route('/upload', methods=['POST'])
+def upload():
+    """
+    Receives a dataset, either as the 'file' field of a multipart form, or as the request body (text/csv).
+    The session ID is given by the 'session' query parameter or form field.
+
+    Returns:
+        202 with the progress of the upload (see UploadProgress.to_dict), which can be polled at /upload/<upload_id>.
+    """
+    session_id = request.args.get('session')
+    is_form = request.mimetype == 'multipart/form-data'
+    if not session_id and is_form:
+        session_id = request.form.get('session')
+    if not session_id or not _ID.match(session_id):
+        return jsonify(error='Missing or invalid session ID.'), 400
+
+    filename = request.files['file'].filename if is_form and 'file' in request.files else \
+        request.args.get('filename', 'upload.csv')
+    progress = UploadProgress(session_id, filename, request.content_length)
+    progress.save()
+    remove_old_progress()
+
+    try:
+        if is_form:
+            file = request.files.get('file')
+            if file is None or not file.filename.endswith('.csv'):
+                raise ValueError('Please upload a .csv file.')
+            stream = file.stream
+        else:
+            stream = request.stream
+        path = receive_file(stream, progress)
+
+    except Exception as e:
+        progress.error = str(e) if isinstance(e, ValueError) else 'Unable to receive the file.'
+        progress.status = 'error'
+        progress.save()
+        return jsonify(progress.to_dict()), 400
+
+    INGEST_EXECUTOR.submit(ingest_file, path, progress)
+    return jsonify(progress.to_dict()), 202
+
+
+@server.route('/upload/<upload_id>')
+def upload_progress(upload_id):
+    """
+    Returns:
+        The progress of an upload (see UploadProgress.to_dict), or 404 if it is unknown or has expired.
+    """
+    progress = UploadProgress.load(upload_id)
+    if progress is None:
+        return jsonify(error='Unknown upload.'), 404
+    return jsonify(progress.to_dict())
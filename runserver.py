@@ -6,12 +6,18 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + '/classifier')
 
 import argparse
 from app import app
+from inference_client import start_inference_server
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--d', '--debug', help="Turn on debug mode", action="store_true")
+    parser.add_argument('--no-inference-server', help="Do not start the inference server (classifier/"
+                        "inference_server.py), e.g. if it is run separately", action="store_true")
     args = parser.parse_args()
 
     debug = args.d
+    # The classifier model is loaded in a separate process, which the app sends the emails to predict to
+    if not args.no_inference_server:
+        start_inference_server()
     # Run server
     app.run_server(debug=debug)
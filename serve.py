@@ -0,0 +1,96 @@
+"""
+Runs the application in production, with several worker processes (Linux / macOS only).
+
+The application (the default dataset and its search index) is loaded once in the master process, then the workers are
+forked from the master, so they share that memory copy-on-write instead of each loading a copy. The classifier model is
+loaded by the inference server (classifier/inference_server.py), a separate process started before the workers, which
+batches the predictions requested by every worker together. Each master starts its own inference server on a free port,
+and stops it when it exits, so reloading with USR2 and QUIT does not stop the server used by the new workers.
+
+Send these signals to the master process to reload the workers gracefully:
+    HUP: Starts new workers, then stops the old workers once they have finished their requests. The new workers are
+        forked from the already loaded application, so changes to the code or to the dataset are not loaded.
+    USR2, then QUIT to the old master: Starts a new master that loads the application again, then stops the old master
+        and its workers once the new workers are running.
+    TTIN / TTOU: Adds / removes a worker.
+"""
+
+# Insert into system path
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + '/dash_app')
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + '/classifier')
+
+import argparse
+import gc
+import multiprocessing
+from gunicorn.app.base import BaseApplication
+from inference_client import INFERENCE_ADDRESS, free_address, start_inference_server
+
+
+class SpamOrHamApplication(BaseApplication):
+    """Gunicorn application serving the Flask server of the Dash app."""
+
+    def __init__(self, options, inference_address=INFERENCE_ADDRESS):
+        """
+        Args:
+            options (dict): Gunicorn settings, see https://docs.gunicorn.org/en/stable/settings.html.
+            inference_address (tuple): The (host, port) of the inference server used by the workers.
+        """
+        self.options = options
+        self.inference_address = inference_address
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app import server
+        from callbacks import INFERENCE
+
+        INFERENCE.address = self.inference_address
+
+        # The loaded objects are kept for the lifetime of the server, so the garbage collector does not need to scan
+        # them. Otherwise it would write to every object in every worker, copying the shared memory pages.
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+        return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bind', help="Address to listen on", default='127.0.0.1:8050')
+    parser.add_argument('--workers', help="Number of worker processes", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--threads', help="Number of threads handling requests in each worker", type=int, default=4)
+    parser.add_argument('--timeout', help="Seconds before a silent worker is restarted", type=int, default=120)
+    parser.add_argument('--graceful-timeout', help="Seconds for the workers to finish their requests when reloading",
+                        type=int, default=30)
+    parser.add_argument('--max-requests', help="Restart each worker after this many requests (0 to disable)",
+                        type=int, default=0)
+    parser.add_argument('--no-preload', help="Load the application in each worker instead of in the master",
+                        action="store_true")
+    parser.add_argument('--batch-window', help="Seconds the inference server waits for more requests to predict "
+                        "together", type=float)
+    parser.add_argument('--max-batch', help="Maximum number of emails the inference server predicts together",
+                        type=int)
+    parser.add_argument('--no-inference-server', help="Do not start the inference server, e.g. if it is run "
+                        "separately", action="store_true")
+    args = parser.parse_args()
+
+    inference_address = INFERENCE_ADDRESS
+    if not args.no_inference_server:
+        inference_address = free_address()
+        start_inference_server(inference_address, batch_window=args.batch_window, max_batch=args.max_batch)
+
+    SpamOrHamApplication({
+        'bind': args.bind,
+        'workers': args.workers,
+        'threads': args.threads,
+        'worker_class': 'gthread',
+        'timeout': args.timeout,
+        'graceful_timeout': args.graceful_timeout,
+        'max_requests': args.max_requests,
+        'preload_app': not args.no_preload
+    }, inference_address).run()